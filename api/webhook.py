@@ -2,19 +2,31 @@
 Telegram webhook handler for Vercel serverless function.
 """
 
-import json
+import atexit
 import os
 import re
+import socket
+import sys
+import threading
+import time
 import httpx
+import orjson
+from curl_cffi import requests as curl_requests
 import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
 from http.server import BaseHTTPRequestHandler
 from typing import Optional
 
-# Import converter from parent directory
-import sys
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from jm2e import JM2EConverter
+# Import converter from the project root; only fall back to editing sys.path
+# when the runtime doesn't already have the root on it
+try:
+    from jm2e import ConversionResult, JM2EConverter
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from jm2e import ConversionResult, JM2EConverter
 
 TELEGRAM_API = "https://api.telegram.org"
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN", "")
@@ -25,26 +37,71 @@ EDGE_CONFIG = os.environ.get("EDGE_CONFIG", "")  # Connection string with token
 EDGE_CONFIG_ID = os.environ.get("EDGE_CONFIG_ID", "")
 VERCEL_API_TOKEN = os.environ.get("VERCEL_API_TOKEN", "")
 VERCEL_TEAM_ID = os.environ.get("VERCEL_TEAM_ID", "")
+# Connection string split once: "<base url>?token=..."
+_EDGE_BASE, _, _EDGE_QUERY = EDGE_CONFIG.partition("?")
 
 # Legacy Vercel KV support (fallback)
 KV_REST_API_URL = os.environ.get("KV_REST_API_URL", "")
 KV_REST_API_TOKEN = os.environ.get("KV_REST_API_TOKEN", "")
 
-# Lazy-init converters (reused across warm invocations)
-# Key: cookie hash, Value: converter instance
-_converters: dict[str, JM2EConverter] = {}
+# Storage configuration is fixed for the container's lifetime
+_KV_AVAILABLE = bool(
+    (EDGE_CONFIG and EDGE_CONFIG_ID and VERCEL_API_TOKEN)
+    or (KV_REST_API_URL and KV_REST_API_TOKEN)
+)
+
+# Reply to Telegram before handling the update (only for runtimes that keep
+# running after the response; Vercel may freeze the container instead)
+ASYNC_SEND = os.environ.get("JM2E_ASYNC_SEND") == "1"
+
+# Lazy-init converter shared by all users (reused across warm invocations);
+# each user's ExHentai cookie is passed per convert() call
+_converter: Optional[JM2EConverter] = None
+
+# User cookie storage (in-memory LRU cache, may reset on cold start)
+_user_cookies: OrderedDict[int, str] = OrderedDict()
+MAX_USER_COOKIES = 1024
+
+# Per-user preference caches below share this LRU bound
+MAX_USER_SETTINGS = 1024
+
+# User persistence preference (in-memory LRU cache)
+_user_persist: OrderedDict[int, bool] = OrderedDict()
 
-# User cookie storage (in-memory cache, may reset on cold start)
-_user_cookies: dict[int, str] = {}
+# User blur preference (in-memory LRU cache, default True = blur enabled)
+_user_blur: OrderedDict[int, bool] = OrderedDict()
 
-# User persistence preference (in-memory cache)
-_user_persist: dict[int, bool] = {}
+# User wnacg-only preference (in-memory LRU cache, default False)
+_user_wnacg_only: OrderedDict[int, bool] = OrderedDict()
+
+
+# Guards the in-memory caches: with JM2E_ASYNC_SEND several updates are
+# handled at once, and reordering/evicting an OrderedDict isn't atomic
+_cache_lock = threading.Lock()
+
+
+def _lru_put(cache: OrderedDict, key, value, max_size: int) -> None:
+    """Insert into an LRU cache, evicting the least recently used entry."""
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > max_size:
+            cache.popitem(last=False)
+
+
+def _lru_get(cache: OrderedDict, key):
+    """Get a value from an LRU cache and mark it recently used, or None."""
+    with _cache_lock:
+        if key not in cache:
+            return None
+        cache.move_to_end(key)
+        return cache[key]
 
-# User blur preference (in-memory cache, default True = blur enabled)
-_user_blur: dict[int, bool] = {}
 
-# User wnacg-only preference (in-memory cache, default False)
-_user_wnacg_only: dict[int, bool] = {}
+def _lru_pop(cache: OrderedDict, key) -> None:
+    """Remove a key from an LRU cache if present."""
+    with _cache_lock:
+        cache.pop(key, None)
 
 
 # ============== Storage Helper Functions (Edge Config / KV) ==============
@@ -52,26 +109,59 @@ _user_wnacg_only: dict[int, bool] = {}
 
 def kv_available() -> bool:
     """Check if persistent storage is configured (Edge Config or KV)."""
-    # Prefer Edge Config
-    if EDGE_CONFIG and EDGE_CONFIG_ID and VERCEL_API_TOKEN:
-        return True
-    # Fallback to legacy KV
-    return bool(KV_REST_API_URL and KV_REST_API_TOKEN)
+    return _KV_AVAILABLE
+
+
+# Shared client for storage backends (Edge Config, Vercel API, KV), so warm
+# invocations reuse their connections
+_kv_client: Optional[httpx.Client] = None
+
+
+def _get_kv_client() -> httpx.Client:
+    """Get or create shared storage client with connection pooling."""
+    global _kv_client
+    if _kv_client is None:
+        _kv_client = httpx.Client(
+            http2=True,
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        atexit.register(_kv_client.close)
+    return _kv_client
+
+
+# Short-lived cache of Edge Config reads: (read time, value), written through
+# on successful writes and deletes
+_edge_read_cache: OrderedDict[str, tuple[float, Optional[str]]] = OrderedDict()
+EDGE_READ_TTL = 60
+EDGE_READ_CACHE_SIZE = 4096
+
+
+def _edge_cache_put(key: str, value: Optional[str]) -> None:
+    """Remember an Edge Config value for EDGE_READ_TTL seconds."""
+    _lru_put(_edge_read_cache, key, (time.monotonic(), value), EDGE_READ_CACHE_SIZE)
 
 
 def _edge_config_read(key: str) -> Optional[str]:
-    """Read from Edge Config."""
+    """Read from Edge Config (cached for EDGE_READ_TTL seconds)."""
     if not EDGE_CONFIG:
         return None
 
+    cached = _edge_read_cache.get(key)
+    if cached and time.monotonic() - cached[0] < EDGE_READ_TTL:
+        return cached[1]
+
     try:
-        with httpx.Client(timeout=5) as client:
-            resp = client.get(
-                f"{EDGE_CONFIG.split('?')[0]}/item/{key}?{EDGE_CONFIG.split('?')[1]}"
-            )
-            if resp.status_code == 200:
-                return resp.json()
+        resp = _get_kv_client().get(f"{_EDGE_BASE}/item/{key}?{_EDGE_QUERY}", timeout=5)
+        if resp.status_code == 200:
+            value = orjson.loads(resp.content)
+        elif resp.status_code == 404:
+            value = None
+        else:
+            # Server errors are not cached, the next read retries
             return None
+        _edge_cache_put(key, value)
+        return value
     except Exception:
         return None
 
@@ -96,16 +186,19 @@ def _edge_config_write(items: dict) -> bool:
             ]
         }
 
-        with httpx.Client(timeout=10) as client:
-            resp = client.patch(
-                url,
-                headers={
-                    "Authorization": f"Bearer {VERCEL_API_TOKEN}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            return resp.status_code == 200
+        resp = _get_kv_client().patch(
+            url,
+            headers={
+                "Authorization": f"Bearer {VERCEL_API_TOKEN}",
+                "Content-Type": "application/json",
+            },
+            content=orjson.dumps(payload),
+        )
+        if resp.status_code != 200:
+            return False
+        for k, v in items.items():
+            _edge_cache_put(k, v)
+        return True
     except Exception:
         return False
 
@@ -122,16 +215,19 @@ def _edge_config_delete(keys: list[str]) -> bool:
 
         payload = {"items": [{"operation": "delete", "key": k} for k in keys]}
 
-        with httpx.Client(timeout=10) as client:
-            resp = client.patch(
-                url,
-                headers={
-                    "Authorization": f"Bearer {VERCEL_API_TOKEN}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
-            return resp.status_code == 200
+        resp = _get_kv_client().patch(
+            url,
+            headers={
+                "Authorization": f"Bearer {VERCEL_API_TOKEN}",
+                "Content-Type": "application/json",
+            },
+            content=orjson.dumps(payload),
+        )
+        if resp.status_code != 200:
+            return False
+        for k in keys:
+            _edge_cache_put(k, None)
+        return True
     except Exception:
         return False
 
@@ -147,14 +243,57 @@ def kv_get(key: str) -> Optional[str]:
         return None
 
     try:
-        with httpx.Client(timeout=5) as client:
-            resp = client.get(
-                f"{KV_REST_API_URL}/get/{key}",
-                headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
+        resp = _get_kv_client().get(
+            f"{KV_REST_API_URL}/get/{key}",
+            headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
+            timeout=5,
+        )
+        data = orjson.loads(resp.content)
+        result = data.get("result")
+        return result if result else None
+    except Exception:
+        return None
+
+
+def kv_get_many(keys: list[str]) -> Optional[list[Optional[str]]]:
+    """Get several values from storage in one request.
+
+    Returns values in the order of keys (None for missing keys), or None if
+    storage is unavailable or the read failed.
+    """
+    # Edge Config: GET /items?key=a&key=b returns {key: value} for found keys
+    if EDGE_CONFIG:
+        query = urllib.parse.urlencode([("key", k) for k in keys])
+        try:
+            resp = _get_kv_client().get(
+                f"{_EDGE_BASE}/items?{query}&{_EDGE_QUERY}", timeout=5
             )
-            data = resp.json()
-            result = data.get("result")
-            return result if result else None
+            if resp.status_code != 200:
+                return None
+            data = orjson.loads(resp.content)
+            values = [data.get(k) for k in keys]
+            for k, v in zip(keys, values):
+                _edge_cache_put(k, v)
+            return values
+        except Exception:
+            return None
+
+    # Legacy KV: MGET returns a list aligned with keys
+    if not (KV_REST_API_URL and KV_REST_API_TOKEN):
+        return None
+
+    try:
+        resp = _get_kv_client().get(
+            f"{KV_REST_API_URL}/mget/{'/'.join(keys)}",
+            headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
+            timeout=5,
+        )
+        if resp.status_code != 200:
+            return None
+        results = orjson.loads(resp.content).get("result") or []
+        if len(results) != len(keys):
+            return None
+        return [r if r else None for r in results]
     except Exception:
         return None
 
@@ -174,12 +313,12 @@ def kv_set(key: str, value: str, ex: int | None = None) -> bool:
         if ex:
             url += f"?ex={ex}"
 
-        with httpx.Client(timeout=5) as client:
-            resp = client.get(
-                url,
-                headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
-            )
-            return resp.status_code == 200
+        resp = _get_kv_client().get(
+            url,
+            headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
+            timeout=5,
+        )
+        return resp.status_code == 200
     except Exception:
         return False
 
@@ -195,12 +334,43 @@ def kv_delete(key: str) -> bool:
         return False
 
     try:
-        with httpx.Client(timeout=5) as client:
-            resp = client.get(
-                f"{KV_REST_API_URL}/del/{key}",
-                headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
-            )
-            return resp.status_code == 200
+        resp = _get_kv_client().get(
+            f"{KV_REST_API_URL}/del/{key}",
+            headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
+            timeout=5,
+        )
+        return resp.status_code == 200
+    except Exception:
+        return False
+
+
+def kv_set_many(items: dict[str, str]) -> bool:
+    """Set several values in storage, in a single request where possible."""
+    # Edge Config: one PATCH carries every upsert
+    if EDGE_CONFIG and EDGE_CONFIG_ID and VERCEL_API_TOKEN:
+        return _edge_config_write(items)
+
+    # Legacy KV: values travel in the URL path, so set them one by one
+    return all([kv_set(k, v) for k, v in items.items()])
+
+
+def kv_delete_many(keys: list[str]) -> bool:
+    """Delete several keys from storage in one request."""
+    # Edge Config: one PATCH carries every delete
+    if EDGE_CONFIG and EDGE_CONFIG_ID and VERCEL_API_TOKEN:
+        return _edge_config_delete(keys)
+
+    # Legacy KV: DEL accepts multiple keys
+    if not (KV_REST_API_URL and KV_REST_API_TOKEN):
+        return False
+
+    try:
+        resp = _get_kv_client().get(
+            f"{KV_REST_API_URL}/del/{'/'.join(keys)}",
+            headers={"Authorization": f"Bearer {KV_REST_API_TOKEN}"},
+            timeout=5,
+        )
+        return resp.status_code == 200
     except Exception:
         return False
 
@@ -208,11 +378,48 @@ def kv_delete(key: str) -> bool:
 # ============== User Data Management ==============
 
 
+def _load_user(user_id: int) -> None:
+    """Prefetch all of a user's stored settings with one storage request.
+
+    Fills the in-memory caches so the get_user_* calls that follow don't each
+    make their own round trip. Values already cached locally are kept.
+    """
+    if not kv_available():
+        return
+    if all(user_id in cache for cache in (_user_persist, _user_blur, _user_wnacg_only)):
+        return
+
+    values = kv_get_many(
+        [
+            f"user_{user_id}_persist",
+            f"user_{user_id}_cookie",
+            f"user_{user_id}_blur",
+            f"user_{user_id}_wnacg_only",
+        ]
+    )
+    # On a failed read cache nothing, so later lookups retry storage instead
+    # of pinning this user to the defaults
+    if values is None:
+        return
+    persist, cookie, blur, wnacg_only = values
+
+    if user_id not in _user_persist:
+        _lru_put(_user_persist, user_id, persist == "1", MAX_USER_SETTINGS)
+    if persist == "1" and cookie and user_id not in _user_cookies:
+        _lru_put(_user_cookies, user_id, cookie, MAX_USER_COOKIES)
+    # Unset preferences are cached as their defaults
+    if user_id not in _user_blur:
+        _lru_put(_user_blur, user_id, blur != "0", MAX_USER_SETTINGS)
+    if user_id not in _user_wnacg_only:
+        _lru_put(_user_wnacg_only, user_id, wnacg_only == "1", MAX_USER_SETTINGS)
+
+
 def get_user_cookie(user_id: int) -> Optional[str]:
     """Get user's ExHentai cookie (from cache or KV)."""
     # Check in-memory cache first
-    if user_id in _user_cookies:
-        return _user_cookies[user_id]
+    cookie = _lru_get(_user_cookies, user_id)
+    if cookie is not None:
+        return cookie
 
     # Try to load from KV if user has persistence enabled
     if kv_available():
@@ -220,8 +427,8 @@ def get_user_cookie(user_id: int) -> Optional[str]:
         if persist == "1":
             cookie = kv_get(f"user_{user_id}_cookie")
             if cookie:
-                _user_cookies[user_id] = cookie
-                _user_persist[user_id] = True
+                _lru_put(_user_cookies, user_id, cookie, MAX_USER_COOKIES)
+                _lru_put(_user_persist, user_id, True, MAX_USER_SETTINGS)
                 return cookie
 
     return None
@@ -229,7 +436,7 @@ def get_user_cookie(user_id: int) -> Optional[str]:
 
 def set_user_cookie(user_id: int, cookie: str) -> None:
     """Set user's ExHentai cookie."""
-    _user_cookies[user_id] = cookie
+    _lru_put(_user_cookies, user_id, cookie, MAX_USER_COOKIES)
 
     # If user has persistence enabled, save to KV
     if _user_persist.get(user_id) and kv_available():
@@ -238,8 +445,7 @@ def set_user_cookie(user_id: int, cookie: str) -> None:
 
 def delete_user_cookie(user_id: int) -> None:
     """Delete user's ExHentai cookie."""
-    if user_id in _user_cookies:
-        del _user_cookies[user_id]
+    _lru_pop(_user_cookies, user_id)
 
     # Also delete from KV if available
     if kv_available():
@@ -248,13 +454,14 @@ def delete_user_cookie(user_id: int) -> None:
 
 def get_user_persist(user_id: int) -> bool:
     """Check if user has persistence enabled."""
-    if user_id in _user_persist:
-        return _user_persist[user_id]
+    cached = _lru_get(_user_persist, user_id)
+    if cached is not None:
+        return cached
 
     if kv_available():
         persist = kv_get(f"user_{user_id}_persist")
         result = persist == "1"
-        _user_persist[user_id] = result
+        _lru_put(_user_persist, user_id, result, MAX_USER_SETTINGS)
         return result
 
     return False
@@ -268,51 +475,49 @@ def set_user_persist(user_id: int, enabled: bool) -> bool:
     if not kv_available():
         return False
 
-    _user_persist[user_id] = enabled
+    _lru_put(_user_persist, user_id, enabled, MAX_USER_SETTINGS)
 
     if enabled:
-        # Write persist flag
-        if not kv_set(f"user_{user_id}_persist", "1"):
+        # Write persist flag, plus the current cookie if one exists
+        items = {f"user_{user_id}_persist": "1"}
+        cookie = _user_cookies.get(user_id)
+        if cookie:
+            items[f"user_{user_id}_cookie"] = cookie
+        if not kv_set_many(items):
             return False
-        # Also persist current cookie if exists
-        if user_id in _user_cookies:
-            if not kv_set(f"user_{user_id}_cookie", _user_cookies[user_id]):
-                return False
     else:
-        kv_delete(f"user_{user_id}_persist")
-        kv_delete(f"user_{user_id}_cookie")
+        kv_delete_many([f"user_{user_id}_persist", f"user_{user_id}_cookie"])
 
     return True
 
 
 def delete_all_user_data(user_id: int) -> None:
     """Delete all user data (cookie + persistence setting + blur setting + wnacg_only)."""
-    if user_id in _user_cookies:
-        del _user_cookies[user_id]
-    if user_id in _user_persist:
-        del _user_persist[user_id]
-    if user_id in _user_blur:
-        del _user_blur[user_id]
-    if user_id in _user_wnacg_only:
-        del _user_wnacg_only[user_id]
+    for cache in (_user_cookies, _user_persist, _user_blur, _user_wnacg_only):
+        _lru_pop(cache, user_id)
 
     if kv_available():
-        kv_delete(f"user_{user_id}_cookie")
-        kv_delete(f"user_{user_id}_persist")
-        kv_delete(f"user_{user_id}_blur")
-        kv_delete(f"user_{user_id}_wnacg_only")
+        kv_delete_many(
+            [
+                f"user_{user_id}_cookie",
+                f"user_{user_id}_persist",
+                f"user_{user_id}_blur",
+                f"user_{user_id}_wnacg_only",
+            ]
+        )
 
 
 def get_user_blur(user_id: int) -> bool:
     """Get user's blur preference. Default is True (blur enabled)."""
-    if user_id in _user_blur:
-        return _user_blur[user_id]
+    cached = _lru_get(_user_blur, user_id)
+    if cached is not None:
+        return cached
 
     if kv_available():
         blur = kv_get(f"user_{user_id}_blur")
         if blur is not None:
             result = blur != "0"  # "0" means disabled
-            _user_blur[user_id] = result
+            _lru_put(_user_blur, user_id, result, MAX_USER_SETTINGS)
             return result
 
     return True  # Default: blur enabled
@@ -320,7 +525,7 @@ def get_user_blur(user_id: int) -> bool:
 
 def set_user_blur(user_id: int, enabled: bool) -> None:
     """Set user's blur preference."""
-    _user_blur[user_id] = enabled
+    _lru_put(_user_blur, user_id, enabled, MAX_USER_SETTINGS)
 
     # If user has persistence enabled, save to KV
     if _user_persist.get(user_id) and kv_available():
@@ -329,14 +534,15 @@ def set_user_blur(user_id: int, enabled: bool) -> None:
 
 def get_user_wnacg_only(user_id: int) -> bool:
     """Get user's wnacg-only preference. Default is False."""
-    if user_id in _user_wnacg_only:
-        return _user_wnacg_only[user_id]
+    cached = _lru_get(_user_wnacg_only, user_id)
+    if cached is not None:
+        return cached
 
     if kv_available():
         wnacg_only = kv_get(f"user_{user_id}_wnacg_only")
         if wnacg_only is not None:
             result = wnacg_only == "1"
-            _user_wnacg_only[user_id] = result
+            _lru_put(_user_wnacg_only, user_id, result, MAX_USER_SETTINGS)
             return result
 
     return False  # Default: wnacg-only disabled
@@ -344,19 +550,169 @@ def get_user_wnacg_only(user_id: int) -> bool:
 
 def set_user_wnacg_only(user_id: int, enabled: bool) -> None:
     """Set user's wnacg-only preference."""
-    _user_wnacg_only[user_id] = enabled
+    _lru_put(_user_wnacg_only, user_id, enabled, MAX_USER_SETTINGS)
 
     # If user has persistence enabled, save to KV
     if _user_persist.get(user_id) and kv_available():
         kv_set(f"user_{user_id}_wnacg_only", "1" if enabled else "0")
 
 
-def get_converter(exhentai_cookie: Optional[str] = None) -> JM2EConverter:
-    """Get or create converter instance."""
-    cache_key = str(hash(exhentai_cookie)) if exhentai_cookie else "default"
-    if cache_key not in _converters:
-        _converters[cache_key] = JM2EConverter(exhentai_cookie=exhentai_cookie)
-    return _converters[cache_key]
+def get_converter() -> JM2EConverter:
+    """Get or create the shared converter instance."""
+    global _converter
+    if _converter is None:
+        _converter = JM2EConverter()
+    return _converter
+
+
+# Recent conversion results: (jm_id, wnacg_only, has_cookie) -> (time, result).
+# Inline queries repeat the same ID as the user types, and a cookie only
+# matters for whether ExHentai is searched, not whose it is.
+_convert_cache: OrderedDict[tuple[str, bool, bool], tuple[float, ConversionResult]] = (
+    OrderedDict()
+)
+CONVERT_CACHE_TTL = 300  # Matches the inline answer's cache_time
+CONVERT_CACHE_SIZE = 1024
+
+
+def peek_convert_cache(
+    jm_id: str, wnacg_only: bool = False, exhentai_cookie: Optional[str] = None
+) -> Optional[ConversionResult]:
+    """Return a fresh cached conversion result, or None without converting."""
+    cached = _convert_cache.get((jm_id, wnacg_only, bool(exhentai_cookie)))
+    if cached and time.monotonic() - cached[0] < CONVERT_CACHE_TTL:
+        return cached[1]
+    return None
+
+
+def convert_cached(
+    jm_id: str, wnacg_only: bool = False, exhentai_cookie: Optional[str] = None
+) -> ConversionResult:
+    """Convert a JM ID, reusing a result from the last CONVERT_CACHE_TTL seconds.
+
+    Only results with a link are cached: the converter reports upstream
+    errors as a "none" result, so those are retried on the next attempt.
+    """
+    result = peek_convert_cache(jm_id, wnacg_only, exhentai_cookie)
+    if result is not None:
+        return result
+
+    result = get_converter().convert(
+        jm_id, wnacg_only=wnacg_only, exhentai_cookie=exhentai_cookie
+    )
+    if result.link:
+        key = (jm_id, wnacg_only, bool(exhentai_cookie))
+        _lru_put(_convert_cache, key, (time.monotonic(), result), CONVERT_CACHE_SIZE)
+    return result
+
+
+# Shared Telegram API client (connection pool reused across warm invocations)
+_tg_client: Optional[httpx.Client] = None
+
+
+def _get_tg_client() -> httpx.Client:
+    """Get or create shared Telegram API client with connection pooling."""
+    global _tg_client
+    if _tg_client is None:
+        _tg_client = httpx.Client(
+            base_url=f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}",
+            # Background reactions/typing run alongside the reply; HTTP/2
+            # multiplexes them over one connection
+            http2=True,
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        atexit.register(_tg_client.close)
+    return _tg_client
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+# Longest flood-control wait (seconds) honoured before giving up on a call
+TG_MAX_RETRY_AFTER = 5
+
+
+def _tg_post(method: str, payload: dict, timeout: float = 10.0) -> httpx.Response:
+    """POST a JSON payload to a Telegram Bot API method.
+
+    Serializes with orjson instead of httpx's stdlib json encoder. On a 429
+    (flood control) the call is retried once after Telegram's retry_after,
+    if that is short enough to fit in the invocation.
+
+    Failures are logged here, once; callers only decide what to do about them.
+    """
+    body = orjson.dumps(payload)
+    client = _get_tg_client()
+    try:
+        resp = client.post(
+            f"/{method}", content=body, headers=_JSON_HEADERS, timeout=timeout
+        )
+        if resp.status_code == 429:
+            try:
+                retry_after = orjson.loads(resp.content)["parameters"]["retry_after"]
+            except Exception:
+                retry_after = 1
+            if retry_after <= TG_MAX_RETRY_AFTER:
+                time.sleep(retry_after)
+                resp = client.post(
+                    f"/{method}", content=body, headers=_JSON_HEADERS, timeout=timeout
+                )
+    except httpx.HTTPError as e:
+        print(f"Telegram {method} failed: {e}")
+        raise
+    if resp.status_code != 200:
+        print(f"Telegram {method} error {resp.status_code}: {resp.text[:200]}")
+    return resp
+
+
+# Background pool for non-critical Telegram side effects (reactions, typing, ...)
+_bg = ThreadPoolExecutor(max_workers=4)
+_bg_reactions = ThreadPoolExecutor(max_workers=1)
+
+# Futures started while handling an update, tracked per handling thread so
+# concurrent updates (JM2E_ASYNC_SEND) only wait on their own side effects
+_bg_local = threading.local()
+
+
+def _bg_pending() -> list[Future]:
+    """Pending background futures of the update handled on this thread."""
+    try:
+        return _bg_local.pending
+    except AttributeError:
+        _bg_local.pending = []
+        return _bg_local.pending
+
+
+def _fire(fn, *args, **kwargs) -> Future:
+    """Run a call in the background pool and return its future."""
+    future = _bg.submit(fn, *args, **kwargs)
+    _bg_pending().append(future)
+    return future
+
+
+def _fire_reaction(chat_id: int, message_id: int | None, emoji: str) -> None:
+    """Set a message reaction in the background.
+
+    Reactions share a single worker so a later reaction can never be
+    overtaken by an earlier one (e.g. 👀 landing after 🔥).
+    """
+    _bg_pending().append(
+        _bg_reactions.submit(set_message_reaction, chat_id, message_id, emoji)
+    )
+
+
+def _flush_background(timeout: float = 10.0) -> None:
+    """Wait for the background calls started by this thread's update.
+
+    Vercel may freeze the container once the response is sent, so side
+    effects must finish within the invocation that started them.
+    """
+    pending_list = _bg_pending()
+    pending = pending_list[:]
+    pending_list.clear()
+    if pending:
+        wait(pending, timeout=timeout)
 
 
 def send_message(
@@ -382,14 +738,10 @@ def send_message(
         payload["reply_markup"] = reply_markup
 
     try:
-        with httpx.Client(timeout=10) as client:
-            resp = client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/sendMessage",
-                json=payload,
-            )
-            data = resp.json()
-            if data.get("ok"):
-                return data.get("result", {}).get("message_id")
+        resp = _tg_post("sendMessage", payload)
+        data = orjson.loads(resp.content)
+        if data.get("ok"):
+            return data.get("result", {}).get("message_id")
     except Exception:
         pass
     return None
@@ -398,21 +750,14 @@ def send_message(
 def delete_message(chat_id: int, message_id: int):
     """Delete a message via Telegram API."""
     try:
-        with httpx.Client(timeout=10) as client:
-            client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/deleteMessage",
-                json={"chat_id": chat_id, "message_id": message_id},
-            )
+        _tg_post("deleteMessage", {"chat_id": chat_id, "message_id": message_id})
     except Exception:
         pass  # Ignore deletion errors
 
 
-def set_my_commands():
-    """Set bot commands for the menu button.
-
-    This creates the slash command menu that appears when users type '/'.
-    """
-    commands = [
+# Static command menu; only needs to reach Telegram once per container
+_COMMANDS_PAYLOAD = {
+    "commands": [
         {"command": "start", "description": "开始使用 / 查看引导"},
         {"command": "jm", "description": "转换 JM ID (例: /jm 540930)"},
         {"command": "setcookie", "description": "设置 ExHentai Cookie"},
@@ -422,14 +767,24 @@ def set_my_commands():
         {"command": "forget", "description": "删除所有数据"},
         {"command": "help", "description": "显示帮助信息"},
     ]
+}
+_commands_set = False
+
+
+def set_my_commands():
+    """Set bot commands for the menu button.
+
+    This creates the slash command menu that appears when users type '/'.
+    Skipped once it has succeeded in this container.
+    """
+    global _commands_set
+    if _commands_set:
+        return True
 
     try:
-        with httpx.Client(timeout=10) as client:
-            resp = client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/setMyCommands",
-                json={"commands": commands},
-            )
-            return resp.status_code == 200
+        resp = _tg_post("setMyCommands", _COMMANDS_PAYLOAD)
+        _commands_set = resp.status_code == 200
+        return _commands_set
     except Exception:
         return False
 
@@ -444,11 +799,7 @@ def send_chat_action(chat_id: int, action: str = "typing"):
     - find_location: for location data
     """
     try:
-        with httpx.Client(timeout=5) as client:
-            client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/sendChatAction",
-                json={"chat_id": chat_id, "action": action},
-            )
+        _tg_post("sendChatAction", {"chat_id": chat_id, "action": action}, timeout=5)
     except Exception:
         pass  # Non-critical, ignore errors
 
@@ -464,16 +815,16 @@ def set_message_reaction(
         return
 
     try:
-        with httpx.Client(timeout=5) as client:
-            client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/setMessageReaction",
-                json={
-                    "chat_id": chat_id,
-                    "message_id": message_id,
-                    "reaction": [{"type": "emoji", "emoji": emoji}],
-                    "is_big": is_big,
-                },
-            )
+        _tg_post(
+            "setMessageReaction",
+            {
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "reaction": [{"type": "emoji", "emoji": emoji}],
+                "is_big": is_big,
+            },
+            timeout=5,
+        )
     except Exception:
         pass  # Reactions may not be available in all chats
 
@@ -496,15 +847,31 @@ def edit_message(
         payload["reply_markup"] = reply_markup
 
     try:
-        with httpx.Client(timeout=10) as client:
-            client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/editMessageText",
-                json=payload,
-            )
+        _tg_post("editMessageText", payload)
     except Exception:
         pass  # Fall back to sending new message if edit fails
 
 
+# Cover URLs Telegram recently failed to fetch: url -> time of failure.
+# These are skipped in favour of a text reply until the entry expires.
+_bad_cover_urls: OrderedDict[str, float] = OrderedDict()
+BAD_COVER_URL_TTL = 600
+BAD_COVER_URL_CACHE_SIZE = 1024
+
+# sendPhoto error descriptions meaning Telegram couldn't fetch the photo itself
+_PHOTO_FETCH_ERRORS = (
+    "wrong file identifier/HTTP URL specified",
+    "failed to get HTTP URL content",
+    "wrong type of the web page content",
+)
+
+
+def cover_url_ok(photo_url: str) -> bool:
+    """Check that photo_url hasn't recently failed to load as a cover."""
+    failed_at = _bad_cover_urls.get(photo_url)
+    return failed_at is None or time.monotonic() - failed_at >= BAD_COVER_URL_TTL
+
+
 def send_photo(
     chat_id: int,
     photo_url: str,
@@ -540,14 +907,16 @@ def send_photo(
         payload["has_spoiler"] = True
 
     try:
-        with httpx.Client(timeout=15) as client:
-            resp = client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/sendPhoto",
-                json=payload,
+        resp = _tg_post("sendPhoto", payload, timeout=15)
+        data = orjson.loads(resp.content)
+        if data.get("ok"):
+            return data.get("result", {}).get("message_id")
+        # Remember covers Telegram couldn't fetch
+        description = data.get("description", "")
+        if any(error in description for error in _PHOTO_FETCH_ERRORS):
+            _lru_put(
+                _bad_cover_urls, photo_url, time.monotonic(), BAD_COVER_URL_CACHE_SIZE
             )
-            data = resp.json()
-            if data.get("ok"):
-                return data.get("result", {}).get("message_id")
     except Exception:
         pass
     return None
@@ -576,45 +945,66 @@ def edit_message_media(
         payload["reply_markup"] = reply_markup
 
     try:
-        with httpx.Client(timeout=15) as client:
-            resp = client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/editMessageMedia",
-                json=payload,
-            )
-            return resp.json().get("ok", False)
+        resp = _tg_post("editMessageMedia", payload, timeout=15)
+        return orjson.loads(resp.content).get("ok", False)
     except Exception:
         return False
 
 
+# Translation table for escape_html (single pass over the string)
+_HTML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
 def escape_html(text: str) -> str:
     """Escape special characters for Telegram HTML.
 
     Characters that need escaping: < > &
     """
-    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.translate(_HTML_ESCAPE)
+
+
+def _format_error(e: Exception, limit: int) -> str:
+    """Format an exception for a user-facing reply, at most limit chars.
+
+    Single string args (the common case) are sliced directly instead of
+    going through str(e), which may render large response bodies.
+    """
+    args = e.args
+    if len(args) == 1 and isinstance(args[0], str):
+        message = args[0][:limit]
+    else:
+        message = str(e)[:limit]
+    return message or type(e).__name__
 
 
+# Pre-compiled regex for the ; / newline separators between cookie pairs
+_COOKIE_SPLIT_RE = re.compile(r"[;\n]")
+
+
+@lru_cache(maxsize=64)
 def normalize_cookie(raw: str) -> Optional[str]:
     """Normalize cookie input to standard format.
 
     Accepts:
     - Standard: "ipb_member_id=123; ipb_pass_hash=abc; igneous=xyz"
     - Key: value: "ipb_member_id: 123\\nipb_pass_hash: abc"
+
+    Cached so users re-pasting the same cookie after a failed verify skip
+    the parse.
     """
     if not raw:
         return None
 
     parts = {}
-    lines = raw.replace(";", "\n").split("\n")
 
-    for token in lines:
+    for token in _COOKIE_SPLIT_RE.split(raw):
         token = token.strip()
         if not token:
             continue
 
         # Try "key: value" format
-        if ": " in token:
-            key, _, value = token.partition(": ")
+        key, sep, value = token.partition(": ")
+        if sep:
             key = key.strip()
             value = value.strip()
             if key and value:
@@ -622,13 +1012,12 @@ def normalize_cookie(raw: str) -> Optional[str]:
                 continue
 
         # Try "key=value" format
-        if "=" in token:
-            key, _, value = token.partition("=")
+        key, sep, value = token.partition("=")
+        if sep:
             key = key.strip()
             value = value.strip()
             if key and value:
                 parts[key] = value
-                continue
 
     if not parts:
         return None
@@ -636,390 +1025,650 @@ def normalize_cookie(raw: str) -> Optional[str]:
     return "; ".join(f"{k}={v}" for k, v in parts.items())
 
 
+# Cookies that recently passed verification: cookie -> time verified
+_cookie_verify_cache: dict[str, float] = {}
+COOKIE_VERIFY_TTL = 900  # seconds
+COOKIE_VERIFY_CACHE_SIZE = 256
+VERIFY_PEEK_BYTES = 4096  # body prefix read when verifying a cookie
+
+
+# Pre-compiled regex for the sad panda page served to invalid cookies
+_SAD_PANDA_RE = re.compile(rb"sad panda", re.IGNORECASE)
+
+
+# Shared ExHentai session for cookie checks (keeps the TLS connection warm);
+# the lock serializes checks so the cookie jar can be cleared per request
+_eh_session: Optional[curl_requests.Session] = None
+_eh_session_lock = threading.Lock()
+
+
+def _get_eh_session() -> curl_requests.Session:
+    """Get or create the shared ExHentai session. Call with the lock held."""
+    global _eh_session
+    if _eh_session is None:
+        _eh_session = curl_requests.Session(impersonate="chrome")
+        atexit.register(_eh_session.close)
+    return _eh_session
+
+
 def verify_exhentai_cookie(cookie: str) -> bool:
-    """Verify ExHentai cookie by making a test request."""
-    try:
-        from curl_cffi import requests as curl_requests
+    """Verify ExHentai cookie by making a test request.
 
+    Successful checks are cached for COOKIE_VERIFY_TTL seconds so re-pasting
+    the same cookie skips the round trip to exhentai.org. Failures are not
+    cached, so a cookie whose account was just fixed is checked again.
+    """
+    verified_at = _cookie_verify_cache.get(cookie)
+    if verified_at is not None and time.monotonic() - verified_at < COOKIE_VERIFY_TTL:
+        return True
+
+    try:
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
             "Cookie": cookie,
+            # Ask the server to stop after the peeked prefix, where honoured
+            "Range": f"bytes=0-{VERIFY_PEEK_BYTES - 1}",
         }
-        resp = curl_requests.get(
-            "https://exhentai.org/",
-            headers=headers,
-            impersonate="chrome",
-            timeout=10,
-        )
-        # Check for sad panda (invalid cookie)
-        if "sad panda" in resp.text.lower() or len(resp.text) < 1000:
-            return False
-        return True
+        with _eh_session_lock:
+            session = _get_eh_session()
+            # Never let one user's response cookies ride along with another's
+            session.cookies.clear()
+            resp = session.get(
+                "https://exhentai.org/", headers=headers, timeout=10, stream=True
+            )
+            try:
+                # The sad panda page is tiny; a logged-in front page is not.
+                # Only read far enough to tell them apart.
+                body = b""
+                for chunk in resp.iter_content():
+                    body += chunk
+                    if len(body) >= VERIFY_PEEK_BYTES:
+                        break
+            finally:
+                resp.close()
+        # Check for sad panda (invalid cookie) on the raw bytes, no decode
+        valid = len(body) >= 1000 and not _SAD_PANDA_RE.search(body)
     except Exception:
         return False
 
+    if not valid:
+        return False
+
+    with _cache_lock:
+        if len(_cookie_verify_cache) >= COOKIE_VERIFY_CACHE_SIZE:
+            # Evict oldest entry (dicts keep insertion order)
+            _cookie_verify_cache.pop(next(iter(_cookie_verify_cache)))
+        _cookie_verify_cache[cookie] = time.monotonic()
+    return True
+
 
 def looks_like_cookie(text: str) -> bool:
     """Check if text looks like an ExHentai cookie."""
-    return "ipb_member_id" in text and "ipb_pass_hash" in text
+    # Two field names plus a 32-char pass hash never fit in under 40 chars
+    if len(text) < 40:
+        return False
+    # Both names share the "ipb_" prefix; scan for it once, then only look
+    # for the full names from there on
+    start = text.find("ipb_")
+    if start < 0:
+        return False
+    return (
+        text.find("ipb_pass_hash", start) >= 0
+        and text.find("ipb_member_id", start) >= 0
+    )
+
+
+# Pre-compiled regex for JM ID extraction (all supported formats in one pass):
+# Pre-compiled regexes for JM ID formats, tried in priority order:
+# /jm <id>, JM<id>, JMComic URL, album/photo ID in URL (bare IDs are checked
+# with isdigit before these run)
+_JM_CMD_RE = re.compile(r"^/jm\s*(\d+)$", re.IGNORECASE)
+_JM_PREFIX_RE = re.compile(r"\bjm[\s\-_]?(\d{5,7})\b", re.IGNORECASE)
+_JM_URL_RE = re.compile(r"jmcomic[^\d]*(\d{5,7})", re.IGNORECASE)
+_JM_ALBUM_RE = re.compile(r"(?:album|photo)[/=](\d{5,7})", re.IGNORECASE)
+
+# Substrings required by every format other than the bare ID
+_JM_ID_MARKERS = ("jm", "album", "photo")
 
 
 def extract_jm_id(text: str) -> Optional[str]:
     """Extract JMComic ID from various formats."""
-    # Pattern: /jm <id> or /jm<id>
-    match = re.match(r"^/jm\s*(\d+)$", text, re.IGNORECASE)
+    # Bare ID, the most common input (isascii keeps out non-ASCII digits)
+    if 5 <= len(text) <= 7 and text.isascii() and text.isdigit():
+        return text
+
+    # Fast reject: every supported format contains digits
+    if not any(c.isdigit() for c in text):
+        return None
+
+    # Every remaining format needs a marker, skip the full scan without one
+    lowered = text.lower()
+    if not any(marker in lowered for marker in _JM_ID_MARKERS):
+        return None
+
+    match = _JM_CMD_RE.match(text)
     if match:
         return match.group(1)
 
-    # Pattern: just a number (5-7 digits)
-    if re.match(r"^\d{5,7}$", text):
-        return text
-
-    # Pattern: JM<id> or jm<id>
-    match = re.search(r"\bjm[\s\-_]?(\d{5,7})\b", text, re.IGNORECASE)
+    match = _JM_PREFIX_RE.search(text)
     if match:
         return match.group(1)
 
-    # Pattern: JMComic URL
-    match = re.search(r"jmcomic[^\d]*(\d{5,7})", text, re.IGNORECASE)
+    match = _JM_URL_RE.search(text)
     if match:
         return match.group(1)
 
-    # Pattern: album/photo ID in URL
-    match = re.search(r"(?:album|photo)[/=](\d{5,7})", text, re.IGNORECASE)
+    match = _JM_ALBUM_RE.search(text)
     if match:
         return match.group(1)
 
     return None
 
 
-def handle_message(message: dict):
-    """Process incoming Telegram message."""
-    chat_id = message.get("chat", {}).get("id")
-    user_id = message.get("from", {}).get("id")
-    message_id = message.get("message_id")
-    text = message.get("text", "").strip()
+# Static /start replies, built once at import time
+_START_RETURNING_TEMPLATE = (
+    "👋 <b>欢迎回来！</b>\n\n"
+    "✅ ExHentai Cookie 已设置\n"
+    "📦 存储状态: {persist_info}\n\n"
+    "直接发送 JM ID 即可查询，例如:\n"
+    "<code>540930</code>"
+)
+_START_RETURNING_PERSIST = _START_RETURNING_TEMPLATE.format(persist_info="☁️ 云端保存")
+_START_RETURNING_LOCAL = _START_RETURNING_TEMPLATE.format(persist_info="💾 本地缓存")
+_START_RETURNING_KEYBOARD = {
+    "inline_keyboard": [
+        [
+            {"text": "📊 查看状态", "callback_data": "status"},
+            {"text": "❓ 帮助", "callback_data": "help"},
+        ]
+    ]
+}
+
+_START_ONBOARDING = (
+    "🔗 <b>JM2E Bot</b>\n"
+    "<i>JMComic → E-Hentai/ExHentai 链接转换</i>\n\n"
+    "━━━━━━━━━━━━━━━━\n\n"
+    "📖 <b>使用方法</b>\n"
+    "直接发送 JMComic ID 即可查询对应链接\n\n"
+    "💡 <b>示例</b>\n"
+    "<code>540930</code> 或 <code>/jm 540930</code>\n\n"
+    "━━━━━━━━━━━━━━━━\n\n"
+    "🔍 <b>搜索顺序</b>\n"
+    "1. E-Hentai (默认)\n"
+    "2. wnacg (备选)\n\n"
+    "🔞 <b>解锁 ExHentai</b>\n"
+    "设置 Cookie 后可搜索 ExHentai，找到更多内容\n\n"
+    "🖼️ <b>封面模糊</b>\n"
+    "默认开启，使用 /blur 切换"
+)
+_START_ONBOARDING_KEYBOARD = {
+    "inline_keyboard": [
+        [
+            {"text": "🍪 设置 Cookie", "callback_data": "guide_cookie"},
+        ],
+        [
+            {"text": "🚀 直接开始使用", "callback_data": "dismiss"},
+            {"text": "❓ 帮助", "callback_data": "help"},
+        ],
+    ]
+}
+
+
+# /help reply; the cloud storage section depends only on the deployment
+_HELP_CLOUD_SECTION = (
+    "\n<b>☁️ 云端存储</b>\n/persist - 启用云端存储\n/forget - 删除所有数据\n"
+    if _KV_AVAILABLE
+    else ""
+)
+_HELP_TEXT = (
+    "📖 <b>JM2E Bot 帮助</b>\n\n"
+    "<b>🔍 基本用法</b>\n"
+    "• 直接发送 ID: <code>540930</code>\n"
+    "• 使用命令: <code>/jm 540930</code>\n"
+    "• 粘贴 JMComic 链接\n\n"
+    "<b>📋 命令列表</b>\n"
+    "/start - 开始使用\n"
+    "/jm &lt;id&gt; - 转换 JM ID\n"
+    "/status - 查看当前状态\n"
+    "/setcookie - 设置 Cookie\n"
+    f"{_HELP_CLOUD_SECTION}\n"
+    "<b>🍪 设置 Cookie</b>\n"
+    "直接粘贴 Cookie，或:\n"
+    "<code>/setcookie ipb_member_id=xxx; ipb_pass_hash=xxx</code>"
+)
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to limit chars with a trailing "..." (short text is returned as is)."""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+@lru_cache(maxsize=256)
+def _display_fields(title: str, author: str, limit: int) -> tuple[str, str, str]:
+    """Truncated title, plus HTML-escaped title and author, for a result.
+
+    Cached results are shown again on repeat lookups, so this is memoized too.
+    """
+    title_raw = _truncate(title, limit)
+    return title_raw, escape_html(title_raw), escape_html(author)
 
-    if not chat_id or not text:
-        return
 
-    # Get user's ExHentai cookie if set (from cache or KV)
-    user_cookie = get_user_cookie(user_id)
-    user_has_persist = get_user_persist(user_id)
+# Result source -> (emoji, display name)
+_SOURCE_META = {
+    "exhentai": ("🔞", "ExHentai"),
+    "ehentai": ("✅", "E-Hentai"),
+    "wnacg": ("📗", "绅士漫画"),
+}
 
-    # Handle /start command - Onboarding flow
-    if text == "/start":
-        # Set bot commands menu (do this once on start)
-        set_my_commands()
 
-        if user_cookie:
-            # Returning user with cookie set
-            persist_info = "☁️ 云端保存" if user_has_persist else "💾 本地缓存"
-            send_message(
-                chat_id,
-                f"👋 <b>欢迎回来！</b>\n\n"
-                f"✅ ExHentai Cookie 已设置\n"
-                f"📦 存储状态: {persist_info}\n\n"
-                f"直接发送 JM ID 即可查询，例如:\n"
-                f"<code>540930</code>",
-                parse_mode="HTML",
-                reply_markup={
-                    "inline_keyboard": [
-                        [
-                            {"text": "📊 查看状态", "callback_data": "status"},
-                            {"text": "❓ 帮助", "callback_data": "help"},
-                        ]
-                    ]
-                },
-            )
-        else:
-            # New user - show onboarding
-            send_message(
-                chat_id,
-                "🔗 <b>JM2E Bot</b>\n"
-                "<i>JMComic → E-Hentai/ExHentai 链接转换</i>\n\n"
-                "━━━━━━━━━━━━━━━━\n\n"
-                "📖 <b>使用方法</b>\n"
-                "直接发送 JMComic ID 即可查询对应链接\n\n"
-                "💡 <b>示例</b>\n"
-                "<code>540930</code> 或 <code>/jm 540930</code>\n\n"
-                "━━━━━━━━━━━━━━━━\n\n"
-                "🔍 <b>搜索顺序</b>\n"
-                "1. E-Hentai (默认)\n"
-                "2. wnacg (备选)\n\n"
-                "🔞 <b>解锁 ExHentai</b>\n"
-                "设置 Cookie 后可搜索 ExHentai，找到更多内容\n\n"
-                "🖼️ <b>封面模糊</b>\n"
-                "默认开启，使用 /blur 切换",
-                parse_mode="HTML",
-                reply_markup={
-                    "inline_keyboard": [
-                        [
-                            {"text": "🍪 设置 Cookie", "callback_data": "guide_cookie"},
-                        ],
-                        [
-                            {"text": "🚀 直接开始使用", "callback_data": "dismiss"},
-                            {"text": "❓ 帮助", "callback_data": "help"},
-                        ],
-                    ]
-                },
-            )
-        return
+# Lookup replies (HTML), shared by messages and inline results
+_RESULT_FOUND_TEMPLATE = (
+    "{emoji} <b>JM{jm_id}</b>\n\n📚 {title}\n✍️ {author}\n🔗 {source}"
+)
+_RESULT_NOT_FOUND_TEMPLATE = (
+    "❌ <b>JM{jm_id}</b>\n\n📚 {title}\n✍️ {author}\n\n未找到匹配的画廊。"
+)
+_RESULT_COOKIE_HINT = "\n\n💡 提示: 设置ExHentai cookie可能找到更多结果。"
+
+
+def _link_keyboard(link: str, jm_id: str) -> dict:
+    """Build the "open link / JMComic" keyboard for a successful lookup.
+
+    Only the two URLs vary per result; everything else is shared.
+    """
+    return {
+        "inline_keyboard": [
+            [
+                {"text": "🔗 打开链接", "url": link},
+                {"text": "📋 JMComic", "url": f"https://18comic.vip/album/{jm_id}"},
+            ]
+        ]
+    }
+
+
+@lru_cache(maxsize=512)
+def _search_url(title: str) -> str:
+    """Google search URL for a title on e-hentai.org (titles repeat on retries)."""
+    return "https://www.google.com/search?q=" + urllib.parse.quote(
+        f"{title} site:e-hentai.org"
+    )
+
+
+def _search_keyboard(title: str, jm_id: str) -> dict:
+    """Build the "Google search / JMComic" keyboard for a lookup with no match."""
+    return {
+        "inline_keyboard": [
+            [
+                {"text": "🔍 Google搜索", "url": _search_url(title)},
+                {"text": "📋 JMComic", "url": f"https://18comic.vip/album/{jm_id}"},
+            ]
+        ]
+    }
+
 
-    # Handle /help command
-    if text == "/help":
-        cloud_section = (
-            "\n<b>☁️ 云端存储</b>\n/persist - 启用云端存储\n/forget - 删除所有数据\n"
-            if kv_available()
-            else ""
+def _cmd_start(
+    chat_id: int, user_id: int, user_cookie: Optional[str], user_has_persist: bool
+) -> None:
+    """Handle /start (onboarding flow)."""
+    # Set bot commands menu in the background, alongside the reply
+    _fire(set_my_commands)
+
+    if user_cookie:
+        # Returning user with cookie set
+        send_message(
+            chat_id,
+            _START_RETURNING_PERSIST if user_has_persist else _START_RETURNING_LOCAL,
+            parse_mode="HTML",
+            reply_markup=_START_RETURNING_KEYBOARD,
         )
+    else:
+        # New user - show onboarding
         send_message(
             chat_id,
-            "📖 <b>JM2E Bot 帮助</b>\n\n"
-            "<b>🔍 基本用法</b>\n"
-            "• 直接发送 ID: <code>540930</code>\n"
-            "• 使用命令: <code>/jm 540930</code>\n"
-            "• 粘贴 JMComic 链接\n\n"
-            "<b>📋 命令列表</b>\n"
-            "/start - 开始使用\n"
-            "/jm &lt;id&gt; - 转换 JM ID\n"
-            "/status - 查看当前状态\n"
-            "/setcookie - 设置 Cookie\n"
-            f"{cloud_section}\n"
-            "<b>🍪 设置 Cookie</b>\n"
-            "直接粘贴 Cookie，或:\n"
-            "<code>/setcookie ipb_member_id=xxx; ipb_pass_hash=xxx</code>",
+            _START_ONBOARDING,
             parse_mode="HTML",
+            reply_markup=_START_ONBOARDING_KEYBOARD,
         )
-        return
 
-    # Handle /status command
-    if text == "/status":
-        cookie_status = "✅ 已设置" if user_cookie else "❌ 未设置"
-        wnacg_only = get_user_wnacg_only(user_id)
-        if wnacg_only:
-            search_order = "wnacg only"
-        elif user_cookie:
-            search_order = "ExHentai → wnacg"
-        else:
-            search_order = "E-Hentai → wnacg"
-        blur_enabled = get_user_blur(user_id)
-        blur_status = "🔒 已开启" if blur_enabled else "🔓 已关闭"
-        wnacg_status = "📗 已开启" if wnacg_only else "❌ 已关闭"
-
-        if kv_available():
-            persist_status = "☁️ 已启用" if user_has_persist else "💾 仅本地"
-            persist_hint = "(已云端保存)" if user_has_persist else "(重启可能丢失)"
-        else:
-            persist_status = "⚠️ 不可用"
-            persist_hint = ""
 
+def _cmd_help(
+    chat_id: int, user_id: int, user_cookie: Optional[str], user_has_persist: bool
+) -> None:
+    """Handle /help."""
+    send_message(chat_id, _HELP_TEXT, parse_mode="HTML")
+
+
+# Shown under /status until the user has a cookie or cloud storage
+_STATUS_SETUP_KEYBOARD = {
+    "inline_keyboard": [
+        [
+            {"text": "🍪 设置 Cookie", "callback_data": "guide_cookie"},
+            {"text": "☁️ 启用云存储", "callback_data": "persist"},
+        ]
+    ]
+}
+
+
+def _cmd_status(
+    chat_id: int, user_id: int, user_cookie: Optional[str], user_has_persist: bool
+) -> None:
+    """Handle /status."""
+    cookie_status = "✅ 已设置" if user_cookie else "❌ 未设置"
+    wnacg_only = get_user_wnacg_only(user_id)
+    if wnacg_only:
+        search_order = "wnacg only"
+    elif user_cookie:
+        search_order = "ExHentai → wnacg"
+    else:
+        search_order = "E-Hentai → wnacg"
+    blur_enabled = get_user_blur(user_id)
+    blur_status = "🔒 已开启" if blur_enabled else "🔓 已关闭"
+    wnacg_status = "📗 已开启" if wnacg_only else "❌ 已关闭"
+
+    if kv_available():
+        persist_status = "☁️ 已启用" if user_has_persist else "💾 仅本地"
+        persist_hint = "(已云端保存)" if user_has_persist else "(重启可能丢失)"
+    else:
+        persist_status = "⚠️ 不可用"
+        persist_hint = ""
+
+    send_message(
+        chat_id,
+        f"📊 <b>当前状态</b>\n\n"
+        f"🍪 Cookie: {cookie_status}\n"
+        f"🔍 搜索顺序: {search_order}\n"
+        f"📗 WNACG-only: {wnacg_status}\n"
+        f"🖼️ 封面模糊: {blur_status}\n"
+        f"☁️ 云端存储: {persist_status} {persist_hint}",
+        parse_mode="HTML",
+        reply_markup=_STATUS_SETUP_KEYBOARD
+        if not user_cookie and not user_has_persist
+        else None,
+    )
+
+
+def _cmd_blur(
+    chat_id: int, user_id: int, user_cookie: Optional[str], user_has_persist: bool
+) -> None:
+    """Handle /blur (toggle cover blur)."""
+    blur_enabled = get_user_blur(user_id)
+    new_blur = not blur_enabled
+    set_user_blur(user_id, new_blur)
+
+    if new_blur:
         send_message(
             chat_id,
-            f"📊 <b>当前状态</b>\n\n"
-            f"🍪 Cookie: {cookie_status}\n"
-            f"🔍 搜索顺序: {search_order}\n"
-            f"📗 WNACG-only: {wnacg_status}\n"
-            f"🖼️ 封面模糊: {blur_status}\n"
-            f"☁️ 云端存储: {persist_status} {persist_hint}",
+            "🔒 封面模糊已<b>开启</b>\n\n点击图片可查看原图。",
             parse_mode="HTML",
-            reply_markup={
-                "inline_keyboard": [
-                    [
-                        {"text": "🍪 设置 Cookie", "callback_data": "guide_cookie"},
-                        {"text": "☁️ 启用云存储", "callback_data": "persist"},
-                    ]
-                ]
-            }
-            if not user_cookie and not user_has_persist
-            else None,
+        )
+    else:
+        send_message(
+            chat_id,
+            "🔓 封面模糊已<b>关闭</b>\n\n封面将直接显示。",
+            parse_mode="HTML",
+        )
+
+
+def _cmd_wnacg(
+    chat_id: int, user_id: int, user_cookie: Optional[str], user_has_persist: bool
+) -> None:
+    """Handle /wnacg (toggle wnacg-only mode)."""
+    wnacg_only = get_user_wnacg_only(user_id)
+    new_wnacg_only = not wnacg_only
+    set_user_wnacg_only(user_id, new_wnacg_only)
+
+    if new_wnacg_only:
+        send_message(
+            chat_id,
+            "📗 <b>WNACG-only 模式已开启</b>\n\n跳过 E-Hentai，只搜索绅士漫画。",
+            parse_mode="HTML",
+        )
+    else:
+        send_message(
+            chat_id,
+            "🔄 <b>WNACG-only 模式已关闭</b>\n\n恢复正常搜索顺序。",
+            parse_mode="HTML",
+        )
+
+
+def _cmd_persist(
+    chat_id: int, user_id: int, user_cookie: Optional[str], user_has_persist: bool
+) -> None:
+    """Handle /persist (enable cloud storage)."""
+    if not kv_available():
+        send_message(
+            chat_id,
+            "⚠️ 云端存储不可用\n\n服务器未配置存储后端。",
         )
         return
 
-    # Handle /blur command (toggle cover blur)
-    if text == "/blur":
-        blur_enabled = get_user_blur(user_id)
-        new_blur = not blur_enabled
-        set_user_blur(user_id, new_blur)
+    if user_has_persist:
+        send_message(
+            chat_id,
+            "☁️ 云端存储已启用\n\n你的cookie已在云端保存，重启不会丢失。",
+        )
+        return
 
-        if new_blur:
-            send_message(
-                chat_id,
-                "🔒 封面模糊已<b>开启</b>\n\n点击图片可查看原图。",
-                parse_mode="HTML",
-            )
-        else:
-            send_message(
-                chat_id,
-                "🔓 封面模糊已<b>关闭</b>\n\n封面将直接显示。",
-                parse_mode="HTML",
-            )
+    if not user_cookie:
+        send_message(
+            chat_id,
+            "❌ 请先设置cookie\n\n使用 /setcookie 设置后再启用云端存储。",
+        )
         return
 
-    # Handle /wnacg command (toggle wnacg-only mode)
-    if text == "/wnacg":
-        wnacg_only = get_user_wnacg_only(user_id)
-        new_wnacg_only = not wnacg_only
-        set_user_wnacg_only(user_id, new_wnacg_only)
+    if set_user_persist(user_id, True):
+        send_message(
+            chat_id,
+            "✅ 云端存储已启用\\!\n\n"
+            "你的cookie已保存到云端，即使服务器重启也不会丢失。\n\n"
+            "使用 /forget 可随时删除云端数据。",
+            parse_mode="MarkdownV2",
+        )
+    else:
+        send_message(chat_id, "❌ 启用失败，请稍后重试。")
 
-        if new_wnacg_only:
-            send_message(
-                chat_id,
-                "📗 <b>WNACG-only 模式已开启</b>\n\n跳过 E-Hentai，只搜索绅士漫画。",
-                parse_mode="HTML",
-            )
-        else:
-            send_message(
-                chat_id,
-                "🔄 <b>WNACG-only 模式已关闭</b>\n\n恢复正常搜索顺序。",
-                parse_mode="HTML",
-            )
+
+def _cmd_forget(
+    chat_id: int, user_id: int, user_cookie: Optional[str], user_has_persist: bool
+) -> None:
+    """Handle /forget (delete all cloud data)."""
+    if not kv_available():
+        send_message(
+            chat_id,
+            "⚠️ 云端存储不可用",
+        )
         return
 
-    # Handle /persist command (enable cloud storage)
-    if text == "/persist":
-        if not kv_available():
-            send_message(
-                chat_id,
-                "⚠️ 云端存储不可用\n\n服务器未配置存储后端。",
-            )
-            return
+    delete_all_user_data(user_id)
+    send_message(
+        chat_id,
+        "🗑️ 已删除所有数据\n\n"
+        "• 云端cookie已删除\n"
+        "• 云端存储已禁用\n"
+        "• 本地缓存已清除\n\n"
+        "如需继续使用ExHentai，请重新设置cookie。",
+    )
 
-        if user_has_persist:
-            send_message(
-                chat_id,
-                "☁️ 云端存储已启用\n\n你的cookie已在云端保存，重启不会丢失。",
-            )
-            return
 
-        if not user_cookie:
-            send_message(
-                chat_id,
-                "❌ 请先设置cookie\n\n使用 /setcookie 设置后再启用云端存储。",
-            )
-            return
+def _handle_cookie(
+    chat_id: int,
+    user_id: int,
+    message_id: int | None,
+    user_has_persist: bool,
+    raw_cookie: str,
+) -> None:
+    """Handle /setcookie or a pasted cookie: parse, verify and store it."""
+    if not raw_cookie:
+        send_message(
+            chat_id,
+            "🍪 *Set ExHentai Cookie*\n\n"
+            "*方法1:* 直接粘贴cookie\n"
+            "```\n"
+            "ipb_member_id: xxx\n"
+            "ipb_pass_hash: xxx\n"
+            "igneous: xxx\n"
+            "```\n\n"
+            "*方法2:* 使用命令\n"
+            "`/setcookie ipb_member_id=xxx; ipb_pass_hash=xxx; igneous=xxx`\n\n"
+            "*获取方法:*\n"
+            "1. 登录 exhentai.org\n"
+            "2. F12 → Application → Cookies\n"
+            "3. 复制上述三个值",
+            parse_mode="Markdown",
+        )
+        return
 
-        if set_user_persist(user_id, True):
-            send_message(
-                chat_id,
-                "✅ 云端存储已启用\\!\n\n"
-                "你的cookie已保存到云端，即使服务器重启也不会丢失。\n\n"
-                "使用 /forget 可随时删除云端数据。",
-                parse_mode="MarkdownV2",
-            )
-        else:
-            send_message(chat_id, "❌ 启用失败，请稍后重试。")
+    cookie = normalize_cookie(raw_cookie)
+
+    if not cookie:
+        send_message(
+            chat_id,
+            "❌ 无法解析cookie\n\n"
+            "请使用以下格式之一:\n"
+            "• `ipb_member_id=xxx; ipb_pass_hash=xxx`\n"
+            "• 或每行一个 `key: value`",
+            parse_mode="Markdown",
+        )
         return
 
-    # Handle /forget command (delete all cloud data)
-    if text == "/forget":
-        if not kv_available():
-            send_message(
-                chat_id,
-                "⚠️ 云端存储不可用",
-            )
-            return
+    # Validate required fields
+    required = ["ipb_member_id", "ipb_pass_hash"]
+    missing = [f for f in required if f not in cookie]
 
-        delete_all_user_data(user_id)
+    if missing:
         send_message(
             chat_id,
-            "🗑️ 已删除所有数据\n\n"
-            "• 云端cookie已删除\n"
-            "• 云端存储已禁用\n"
-            "• 本地缓存已清除\n\n"
-            "如需继续使用ExHentai，请重新设置cookie。",
+            f"❌ 缺少必要字段: `{', '.join(missing)}`\n\n"
+            "Cookie必须包含:\n"
+            "• `ipb_member_id`\n"
+            "• `ipb_pass_hash`",
+            parse_mode="Markdown",
         )
         return
 
-    # Handle /setcookie command or direct cookie paste
-    is_setcookie_cmd = text.startswith("/setcookie")
-    is_direct_cookie = looks_like_cookie(text) and not text.startswith("/")
+    # Delete user's message for security (do this early)
+    if message_id:
+        _fire(delete_message, chat_id, message_id)
 
-    if is_setcookie_cmd or is_direct_cookie:
-        if is_setcookie_cmd:
-            raw_cookie = text[len("/setcookie") :].strip()
-        else:
-            raw_cookie = text
+    # Verify cookie while the notice is on its way
+    notice_future = _fire(send_message, chat_id, "🔄 正在验证cookie...")
+    valid = verify_exhentai_cookie(cookie)
+    # Keep the notice ahead of the result in the chat
+    notice_future.result()
 
-        if not raw_cookie:
-            send_message(
-                chat_id,
-                "🍪 *Set ExHentai Cookie*\n\n"
-                "*方法1:* 直接粘贴cookie\n"
-                "```\n"
-                "ipb_member_id: xxx\n"
-                "ipb_pass_hash: xxx\n"
-                "igneous: xxx\n"
-                "```\n\n"
-                "*方法2:* 使用命令\n"
-                "`/setcookie ipb_member_id=xxx; ipb_pass_hash=xxx; igneous=xxx`\n\n"
-                "*获取方法:*\n"
-                "1. 登录 exhentai.org\n"
-                "2. F12 → Application → Cookies\n"
-                "3. 复制上述三个值",
-                parse_mode="Markdown",
-            )
-            return
+    if valid:
+        set_user_cookie(user_id, cookie)
 
-        cookie = normalize_cookie(raw_cookie)
+        # Suggest enabling cloud storage
+        persist_hint = ""
+        if kv_available() and not user_has_persist:
+            persist_hint = "\n\n💡 使用 /persist 可启用云端存储，重启不丢失。"
 
-        if not cookie:
-            send_message(
-                chat_id,
-                "❌ 无法解析cookie\n\n"
-                "请使用以下格式之一:\n"
-                "• `ipb_member_id=xxx; ipb_pass_hash=xxx`\n"
-                "• 或每行一个 `key: value`",
-                parse_mode="Markdown",
-            )
-            return
+        send_message(
+            chat_id,
+            f"✅ Cookie验证成功!\n\n"
+            f"搜索将优先使用ExHentai。\n"
+            f"为安全起见，您的cookie消息已删除。{persist_hint}",
+        )
+    else:
+        send_message(
+            chat_id,
+            "❌ Cookie验证失败 (sad panda)\n\n"
+            "可能原因:\n"
+            "• Cookie已过期\n"
+            "• Cookie格式错误\n"
+            "• 账号被封禁\n\n"
+            "请重新从浏览器获取cookie。",
+        )
 
-        # Validate required fields
-        required = ["ipb_member_id", "ipb_pass_hash"]
-        missing = [f for f in required if f not in cookie]
 
-        if missing:
-            send_message(
-                chat_id,
-                f"❌ 缺少必要字段: `{', '.join(missing)}`\n\n"
-                "Cookie必须包含:\n"
-                "• `ipb_member_id`\n"
-                "• `ipb_pass_hash`",
-                parse_mode="Markdown",
-            )
+# Argument-less commands, looked up once per message instead of an if-chain
+_COMMANDS = {
+    "/start": _cmd_start,
+    "/help": _cmd_help,
+    "/status": _cmd_status,
+    "/blur": _cmd_blur,
+    "/wnacg": _cmd_wnacg,
+    "/persist": _cmd_persist,
+    "/forget": _cmd_forget,
+}
+
+
+def _send_result(
+    chat_id: int,
+    text: str,
+    cover_url: str,
+    reply_markup: dict,
+    reply_to_message_id: int | None,
+    blur_future: Future,
+) -> None:
+    """Reply with a lookup result, as a cover photo if possible.
+
+    blur_future resolves to the user's blur preference; it is only waited on
+    when a photo is actually sent.
+    """
+    # Try to send with cover image if available
+    if cover_url and cover_url_ok(cover_url):
+        photo_msg_id = send_photo(
+            chat_id,
+            cover_url,
+            caption=text,
+            parse_mode="HTML",
+            reply_to_message_id=reply_to_message_id,
+            reply_markup=reply_markup,
+            has_spoiler=blur_future.result(),
+        )
+        if photo_msg_id is not None:
             return
 
-        # Delete user's message for security (do this early)
-        if message_id:
-            delete_message(chat_id, message_id)
+    # Fallback to text message if photo failed
+    send_message(
+        chat_id,
+        text,
+        parse_mode="HTML",
+        disable_preview=True,
+        reply_to_message_id=reply_to_message_id,
+        reply_markup=reply_markup,
+    )
 
-        # Verify cookie
-        send_message(chat_id, "🔄 正在验证cookie...")
 
-        if verify_exhentai_cookie(cookie):
-            set_user_cookie(user_id, cookie)
+# Lookups finishing within this many seconds skip the 👀 reaction and typing
+FAST_LOOKUP_TIMEOUT = 0.8
 
-            # Suggest enabling cloud storage
-            persist_hint = ""
-            if kv_available() and not user_has_persist:
-                persist_hint = "\n\n💡 使用 /persist 可启用云端存储，重启不丢失。"
 
-            send_message(
-                chat_id,
-                f"✅ Cookie验证成功!\n\n"
-                f"搜索将优先使用ExHentai。\n"
-                f"为安全起见，您的cookie消息已删除。{persist_hint}",
-            )
-        else:
-            send_message(
-                chat_id,
-                "❌ Cookie验证失败 (sad panda)\n\n"
-                "可能原因:\n"
-                "• Cookie已过期\n"
-                "• Cookie格式错误\n"
-                "• 账号被封禁\n\n"
-                "请重新从浏览器获取cookie。",
-            )
+def handle_message(message: dict):
+    """Process incoming Telegram message."""
+    chat_id = message.get("chat", {}).get("id")
+    user_id = message.get("from", {}).get("id")
+    message_id = message.get("message_id")
+    text = message.get("text", "").strip()
+
+    if not chat_id or not text:
+        return
+
+    # Get user's ExHentai cookie if set (from cache or KV)
+    _load_user(user_id)
+    user_cookie = get_user_cookie(user_id)
+    user_has_persist = get_user_persist(user_id)
+
+    is_command = text.startswith("/")
+    if is_command:
+        # Commands are keyed by the first token ("/cmd@botname" in groups)
+        parts = text.split(maxsplit=1)
+        command_name = parts[0].partition("@")[0]
+        command = _COMMANDS.get(command_name)
+        if command is not None:
+            command(chat_id, user_id, user_cookie, user_has_persist)
+            return
+
+        # /setcookie takes the cookie as its argument
+        if command_name == "/setcookie":
+            raw_cookie = parts[1] if len(parts) > 1 else ""
+            _handle_cookie(chat_id, user_id, message_id, user_has_persist, raw_cookie)
+            return
+    elif looks_like_cookie(text):
+        # Pasted cookie without the command
+        _handle_cookie(chat_id, user_id, message_id, user_has_persist, text)
         return
 
     # Try to extract JM ID
@@ -1027,159 +1676,140 @@ def handle_message(message: dict):
 
     if not jm_id:
         # Only respond to unknown commands
-        if text.startswith("/"):
+        if is_command:
             send_message(
                 chat_id,
                 "未知命令。使用 /help 查看可用命令。",
             )
         return
 
-    # React to the message to show we received it
-    set_message_reaction(chat_id, message_id, "👀")
-
-    # Show typing indicator
-    send_chat_action(chat_id, "typing")
+    # Blur preference is only needed once the result is ready; load it
+    # (possibly a KV round trip) while the converter is running
+    blur_future = _fire(get_user_blur, user_id)
 
     try:
-        converter = get_converter(user_cookie)
         wnacg_only = get_user_wnacg_only(user_id)
-        result = converter.convert(jm_id, wnacg_only=wnacg_only)
+        # Cache hits answer straight away, without a trip through the pool
+        result = peek_convert_cache(jm_id, wnacg_only, user_cookie)
+        if result is None:
+            convert_future = _fire(
+                convert_cached,
+                jm_id,
+                wnacg_only=wnacg_only,
+                exhentai_cookie=user_cookie,
+            )
+            try:
+                result = convert_future.result(timeout=FAST_LOOKUP_TIMEOUT)
+            except FutureTimeoutError:
+                # Slow lookup: react and show typing so the user knows we're on it
+                _fire_reaction(chat_id, message_id, "👀")
+                _fire(send_chat_action, chat_id, "typing")
+                result = convert_future.result()
 
         if result.link:
             # Success! Update reaction
-            set_message_reaction(chat_id, message_id, "🔥")
+            _fire_reaction(chat_id, message_id, "🔥")
 
-            source_emoji = {"exhentai": "🔞", "ehentai": "✅", "wnacg": "📗"}.get(
-                result.source, "📎"
+            source_emoji, source_name = _SOURCE_META.get(
+                result.source, ("📎", result.source)
             )
-            source_name = {
-                "exhentai": "ExHentai",
-                "ehentai": "E-Hentai",
-                "wnacg": "绅士漫画",
-            }.get(result.source, result.source)
 
             # Escape HTML special chars in title/author
-            title_raw = result.title[:80] + ("..." if len(result.title) > 80 else "")
-            title_display = escape_html(title_raw)
-            author_display = escape_html(result.author)
+            _, title_display, author_display = _display_fields(
+                result.title, result.author, 80
+            )
 
             # Use HTML format - no complex escaping needed
-            response = (
-                f"{source_emoji} <b>JM{jm_id}</b>\n\n"
-                f"📚 {title_display}\n"
-                f"✍️ {author_display}\n"
-                f"🔗 {source_name}"
+            response = _RESULT_FOUND_TEMPLATE.format(
+                emoji=source_emoji,
+                jm_id=jm_id,
+                title=title_display,
+                author=author_display,
+                source=source_name,
             )
 
             # Create inline keyboard with useful buttons
-            inline_keyboard = {
-                "inline_keyboard": [
-                    [
-                        {"text": "🔗 打开链接", "url": result.link},
-                        {
-                            "text": "📋 JMComic",
-                            "url": f"https://18comic.vip/album/{jm_id}",
-                        },
-                    ]
-                ]
-            }
-
-            # Try to send with cover image if available
-            photo_sent = False
-            if result.cover_url:
-                blur_enabled = get_user_blur(user_id)
-                photo_msg_id = send_photo(
-                    chat_id,
-                    result.cover_url,
-                    caption=response,
-                    parse_mode="HTML",
-                    reply_to_message_id=message_id,
-                    reply_markup=inline_keyboard,
-                    has_spoiler=blur_enabled,
-                )
-                photo_sent = photo_msg_id is not None
-
-            # Fallback to text message if photo failed
-            if not photo_sent:
-                send_message(
-                    chat_id,
-                    response,
-                    parse_mode="HTML",
-                    disable_preview=True,
-                    reply_to_message_id=message_id,
-                    reply_markup=inline_keyboard,
-                )
+            inline_keyboard = _link_keyboard(result.link, jm_id)
+
+            _send_result(
+                chat_id,
+                response,
+                result.cover_url,
+                inline_keyboard,
+                message_id,
+                blur_future,
+            )
         else:
             # Not found, sad reaction
-            set_message_reaction(chat_id, message_id, "😢")
+            _fire_reaction(chat_id, message_id, "😢")
 
-            title_raw = result.title[:80] + ("..." if len(result.title) > 80 else "")
-            title_display = escape_html(title_raw)
-            author_display = escape_html(result.author)
+            _, title_display, author_display = _display_fields(
+                result.title, result.author, 80
+            )
 
             # Use HTML format
-            response = (
-                f"❌ <b>JM{jm_id}</b>\n\n"
-                f"📚 {title_display}\n"
-                f"✍️ {author_display}\n\n"
-                "未找到匹配的画廊。"
+            response = _RESULT_NOT_FOUND_TEMPLATE.format(
+                jm_id=jm_id, title=title_display, author=author_display
             )
             if not user_cookie:
-                response += "\n\n💡 提示: 设置ExHentai cookie可能找到更多结果。"
-
-            # Add a button to search manually (URL encode title for search)
-            search_query = urllib.parse.quote(f"{result.title} site:e-hentai.org")
-            inline_keyboard = {
-                "inline_keyboard": [
-                    [
-                        {
-                            "text": "🔍 Google搜索",
-                            "url": f"https://www.google.com/search?q={search_query}",
-                        },
-                        {
-                            "text": "📋 JMComic",
-                            "url": f"https://18comic.vip/album/{jm_id}",
-                        },
-                    ]
-                ]
-            }
-
-            # Try to send with cover image if available
-            photo_sent = False
-            if result.cover_url:
-                blur_enabled = get_user_blur(user_id)
-                photo_msg_id = send_photo(
-                    chat_id,
-                    result.cover_url,
-                    caption=response,
-                    parse_mode="HTML",
-                    reply_to_message_id=message_id,
-                    reply_markup=inline_keyboard,
-                    has_spoiler=blur_enabled,
-                )
-                photo_sent = photo_msg_id is not None
-
-            # Fallback to text message if photo failed
-            if not photo_sent:
-                send_message(
-                    chat_id,
-                    response,
-                    parse_mode="HTML",
-                    disable_preview=True,
-                    reply_to_message_id=message_id,
-                    reply_markup=inline_keyboard,
-                )
+                response += _RESULT_COOKIE_HINT
+
+            # Add a button to search manually
+            inline_keyboard = _search_keyboard(result.title, jm_id)
+
+            _send_result(
+                chat_id,
+                response,
+                result.cover_url,
+                inline_keyboard,
+                message_id,
+                blur_future,
+            )
 
     except Exception as e:
         # Error reaction
-        set_message_reaction(chat_id, message_id, "👎")
+        _fire_reaction(chat_id, message_id, "👎")
 
-        error_msg = str(e)[:150]
+        error_msg = _format_error(e, 150)
         response = f"❌ 查询出错\n\nJM{jm_id}: {error_msg}\n\n请稍后重试。"
 
         send_message(chat_id, response, reply_to_message_id=message_id)
 
 
+def is_relevant_text(text: str) -> bool:
+    """Cheap check for text handle_message might act on.
+
+    Covers commands, JM IDs and links, and pasted cookies; anything else
+    (group chatter, media without text) is dropped before any user
+    settings are loaded.
+    """
+    text = text.lstrip()
+    if not text:
+        return False
+    first = text[0]
+    if first == "/" or first.isdigit() or "ipb_" in text:
+        return True
+    lowered = text.lower()
+    return any(marker in lowered for marker in _JM_ID_MARKERS)
+
+
+# Inline result shown when the query holds no JM ID
+_INLINE_HELP_RESULT = {
+    "type": "article",
+    "id": "help",
+    "title": "🔍 输入JMComic ID",
+    "description": "例如: 540930 或 jm540930",
+    "input_message_content": {
+        "message_text": (
+            "🔗 <b>JM2E Bot</b>\n\n"
+            "使用方法: <code>@bot_username &lt;JM ID&gt;</code>\n"
+            "例如: <code>@bot_username 540930</code>"
+        ),
+        "parse_mode": "HTML",
+    },
+}
+
+
 def handle_inline_query(inline_query: dict):
     """Handle inline query for quick JM ID lookup.
 
@@ -1202,24 +1832,16 @@ def handle_inline_query(inline_query: dict):
 
     if jm_id:
         try:
-            converter = get_converter(user_cookie)
-            result = converter.convert(jm_id)
+            result = convert_cached(jm_id, exhentai_cookie=user_cookie)
 
             if result.link:
-                source_emoji = {"exhentai": "🔞", "ehentai": "✅", "wnacg": "📗"}.get(
-                    result.source, "📎"
+                source_emoji, source_name = _SOURCE_META.get(
+                    result.source, ("📎", result.source)
                 )
-                source_name = {
-                    "exhentai": "ExHentai",
-                    "ehentai": "E-Hentai",
-                    "wnacg": "绅士漫画",
-                }.get(result.source, result.source)
-
-                title_raw = result.title[:60] + (
-                    "..." if len(result.title) > 60 else ""
+
+                title_raw, title_display, author_display = _display_fields(
+                    result.title, result.author, 60
                 )
-                title_display = escape_html(title_raw)
-                author_display = escape_html(result.author)
 
                 # Create article result with thumbnail (use HTML format)
                 article_result = {
@@ -1228,26 +1850,17 @@ def handle_inline_query(inline_query: dict):
                     "title": f"{source_emoji} JM{jm_id}",
                     "description": f"{title_raw} - {result.author}",
                     "input_message_content": {
-                        "message_text": (
-                            f"{source_emoji} <b>JM{jm_id}</b>\n\n"
-                            f"📚 {title_display}\n"
-                            f"✍️ {author_display}\n"
-                            f"🔗 {source_name}"
+                        "message_text": _RESULT_FOUND_TEMPLATE.format(
+                            emoji=source_emoji,
+                            jm_id=jm_id,
+                            title=title_display,
+                            author=author_display,
+                            source=source_name,
                         ),
                         "parse_mode": "HTML",
                         "disable_web_page_preview": True,
                     },
-                    "reply_markup": {
-                        "inline_keyboard": [
-                            [
-                                {"text": "🔗 打开链接", "url": result.link},
-                                {
-                                    "text": "📋 JMComic",
-                                    "url": f"https://18comic.vip/album/{jm_id}",
-                                },
-                            ]
-                        ]
-                    },
+                    "reply_markup": _link_keyboard(result.link, jm_id),
                 }
                 # Add thumbnail if cover URL is available
                 if result.cover_url:
@@ -1256,11 +1869,9 @@ def handle_inline_query(inline_query: dict):
                 results.append(article_result)
             else:
                 # Not found
-                title_raw = result.title[:60] + (
-                    "..." if len(result.title) > 60 else ""
+                title_raw, title_display, author_display = _display_fields(
+                    result.title, result.author, 60
                 )
-                title_display = escape_html(title_raw)
-                author_display = escape_html(result.author)
 
                 article_result = {
                     "type": "article",
@@ -1268,11 +1879,8 @@ def handle_inline_query(inline_query: dict):
                     "title": f"❌ JM{jm_id} - 未找到",
                     "description": f"{title_raw} - 无匹配画廊",
                     "input_message_content": {
-                        "message_text": (
-                            f"❌ <b>JM{jm_id}</b>\n\n"
-                            f"📚 {title_display}\n"
-                            f"✍️ {author_display}\n\n"
-                            "未找到匹配的画廊。"
+                        "message_text": _RESULT_NOT_FOUND_TEMPLATE.format(
+                            jm_id=jm_id, title=title_display, author=author_display
                         ),
                         "parse_mode": "HTML",
                     },
@@ -1283,48 +1891,34 @@ def handle_inline_query(inline_query: dict):
 
                 results.append(article_result)
         except Exception as e:
+            error_msg = _format_error(e, 100)
             results.append(
                 {
                     "type": "article",
                     "id": f"jm_{jm_id}_error",
                     "title": f"❌ JM{jm_id} - 查询出错",
-                    "description": str(e)[:50],
+                    "description": error_msg[:50],
                     "input_message_content": {
-                        "message_text": f"❌ 查询 JM{jm_id} 时出错: {str(e)[:100]}",
+                        "message_text": f"❌ 查询 JM{jm_id} 时出错: {error_msg}",
                     },
                 }
             )
     else:
         # No valid JM ID, show help
-        results.append(
-            {
-                "type": "article",
-                "id": "help",
-                "title": "🔍 输入JMComic ID",
-                "description": "例如: 540930 或 jm540930",
-                "input_message_content": {
-                    "message_text": (
-                        "🔗 <b>JM2E Bot</b>\n\n"
-                        "使用方法: <code>@bot_username &lt;JM ID&gt;</code>\n"
-                        "例如: <code>@bot_username 540930</code>"
-                    ),
-                    "parse_mode": "HTML",
-                },
-            }
-        )
+        results.append(_INLINE_HELP_RESULT)
 
     # Send answer
     try:
-        with httpx.Client(timeout=30) as client:
-            client.post(
-                f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/answerInlineQuery",
-                json={
-                    "inline_query_id": query_id,
-                    "results": results,
-                    "cache_time": 300,  # Cache for 5 minutes
-                    "is_personal": True,  # Results may vary by user (cookie)
-                },
-            )
+        _tg_post(
+            "answerInlineQuery",
+            {
+                "inline_query_id": query_id,
+                "results": results,
+                "cache_time": 300,  # Cache for 5 minutes
+                "is_personal": True,  # Results may vary by user (cookie)
+            },
+            timeout=30,
+        )
     except Exception:
         pass
 
@@ -1341,46 +1935,23 @@ def handle_callback_query(callback_query: dict):
         return
 
     # Answer callback to remove loading state
-    def answer_callback(text: str = "", show_alert: bool = False):
+    def _answer(text: str, show_alert: bool):
         try:
-            with httpx.Client(timeout=5) as client:
-                client.post(
-                    f"{TELEGRAM_API}/bot{TELEGRAM_TOKEN}/answerCallbackQuery",
-                    json={
-                        "callback_query_id": query_id,
-                        "text": text,
-                        "show_alert": show_alert,
-                    },
-                )
+            _tg_post(
+                "answerCallbackQuery",
+                {"callback_query_id": query_id, "text": text, "show_alert": show_alert},
+                timeout=5,
+            )
         except Exception:
             pass
 
+    def answer_callback(text: str = "", show_alert: bool = False):
+        # Runs in the background so it overlaps any follow-up message
+        _fire(_answer, text, show_alert)
+
     if data == "help":
         answer_callback()
-        # Send help message
-        cloud_section = (
-            "\n<b>☁️ 云端存储</b>\n/persist - 启用云端存储\n/forget - 删除所有数据\n"
-            if kv_available()
-            else ""
-        )
-        send_message(
-            chat_id,
-            "📖 <b>JM2E Bot 帮助</b>\n\n"
-            "<b>🔍 基本用法</b>\n"
-            "• 直接发送 ID: <code>540930</code>\n"
-            "• 使用命令: <code>/jm 540930</code>\n"
-            "• 粘贴 JMComic 链接\n\n"
-            "<b>📋 命令列表</b>\n"
-            "/start - 开始使用\n"
-            "/jm &lt;id&gt; - 转换 JM ID\n"
-            "/status - 查看当前状态\n"
-            "/setcookie - 设置 Cookie\n"
-            f"{cloud_section}\n"
-            "<b>🍪 设置 Cookie</b>\n"
-            "直接粘贴 Cookie，或:\n"
-            "<code>/setcookie ipb_member_id=xxx; ipb_pass_hash=xxx</code>",
-            parse_mode="HTML",
-        )
+        send_message(chat_id, _HELP_TEXT, parse_mode="HTML")
 
     elif data == "guide_cookie":
         answer_callback()
@@ -1407,6 +1978,7 @@ def handle_callback_query(callback_query: dict):
 
     elif data == "status":
         answer_callback()
+        _load_user(user_id)
         user_cookie = get_user_cookie(user_id)
         user_has_persist = get_user_persist(user_id)
         cookie_status = "✅ 已设置" if user_cookie else "❌ 未设置"
@@ -1423,6 +1995,7 @@ def handle_callback_query(callback_query: dict):
         )
 
     elif data == "persist":
+        _load_user(user_id)
         user_cookie = get_user_cookie(user_id)
         user_has_persist = get_user_persist(user_id)
 
@@ -1447,47 +2020,117 @@ def handle_callback_query(callback_query: dict):
         answer_callback()
 
 
+def _dispatch_update(update: dict) -> None:
+    """Route a Telegram update to its handler."""
+    # Process message (skipping chatter the bot would ignore anyway)
+    message = update.get("message")
+    if message and is_relevant_text(message.get("text", "")):
+        handle_message(message)
+
+    # Process inline query
+    inline_query = update.get("inline_query")
+    if inline_query:
+        handle_inline_query(inline_query)
+
+    # Process callback query (button clicks)
+    callback_query = update.get("callback_query")
+    if callback_query:
+        handle_callback_query(callback_query)
+
+    # Let background side effects finish before the container freezes
+    _flush_background()
+
+
+# Separate pool for JM2E_ASYNC_SEND: handlers block on _bg futures, so
+# running them on _bg itself could deadlock
+_update_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def _dispatch_update_safely(update: dict) -> None:
+    """Dispatch an update off the request thread, logging any error."""
+    try:
+        _dispatch_update(update)
+    except Exception as e:
+        print(f"Error: {e}")
+        _flush_background()
+
+
+def _warm_up() -> None:
+    """Initialize the converter, open the Telegram connection, set commands."""
+    try:
+        get_converter()
+        _get_tg_client().get("/getMe", timeout=5)
+        set_my_commands()
+    except Exception as e:
+        print(f"Warmup failed: {e}")
+
+
+# Fixed reply bodies
+_BODY_OK = b'{"ok": true}'
+_BODY_RUNNING = b"JM2E Bot is running!"
+
+
+# Telegram updates are well under 1 MB; larger bodies are ignored unread
+MAX_UPDATE_BYTES = 2_000_000
+
+
 class handler(BaseHTTPRequestHandler):
     """Vercel serverless function handler."""
 
+    def setup(self):
+        """Disable Nagle so the small reply is sent without delay."""
+        super().setup()
+        try:
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, AttributeError):
+            pass  # Not a TCP socket (e.g. the platform's own adapter)
+
     def do_POST(self):
         """Handle POST request from Telegram webhook."""
         try:
             content_length = int(self.headers.get("Content-Length", 0))
+            if not 0 < content_length <= MAX_UPDATE_BYTES:
+                # Nothing to read (probes, retries), or far larger than any
+                # Telegram update; don't read it into memory
+                self._send_200(_BODY_OK, "application/json")
+                return
             body = self.rfile.read(content_length)
-            update = json.loads(body.decode("utf-8"))
-
-            # Process message
-            message = update.get("message")
-            if message:
-                handle_message(message)
+            update = orjson.loads(body)
 
-            # Process inline query
-            inline_query = update.get("inline_query")
-            if inline_query:
-                handle_inline_query(inline_query)
+            if ASYNC_SEND:
+                # Reply first so Telegram's connection is released before any
+                # handling starts
+                self._send_200(_BODY_OK, "application/json")
+                _update_pool.submit(_dispatch_update_safely, update)
+                return
 
-            # Process callback query (button clicks)
-            callback_query = update.get("callback_query")
-            if callback_query:
-                handle_callback_query(callback_query)
+            _dispatch_update(update)
 
             # Always return 200 to Telegram
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(b'{"ok": true}')
+            self._send_200(_BODY_OK, "application/json")
 
         except Exception as e:
             print(f"Error: {e}")
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(b'{"ok": true}')
+            _flush_background()
+            self._send_200(_BODY_OK, "application/json")
 
     def do_GET(self):
-        """Health check endpoint."""
-        self.send_response(200)
-        self.send_header("Content-Type", "text/plain")
+        """Health check endpoint (``?warm`` also warms up shared state)."""
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.endswith("/warm") or "warm" in urllib.parse.parse_qs(
+            url.query, keep_blank_values=True
+        ):
+            _warm_up()
+        self._send_200(_BODY_RUNNING, "text/plain")
+
+    def _send_200(self, body: bytes, content_type: str) -> None:
+        """Send a 200 response with a fixed body.
+
+        send_response_only skips the per-request access log line and the
+        Server/Date headers; headers are buffered until end_headers.
+        """
+        self.send_response_only(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(b"JM2E Bot is running!")
+        self.wfile.write(body)
@@ -2,12 +2,17 @@
 JM2E Telegram Bot: Convert JMComic IDs to E-Hentai/ExHentai links.
 """
 
+import asyncio
 import logging
 import os
 import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
 from telegram import Update
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     MessageHandler,
@@ -26,89 +31,149 @@ logger = logging.getLogger(__name__)
 # Telegram Bot Token (from environment variable)
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 
-# Global converter cache (keyed by cookie hash for reuse)
-_converters: dict[str, JM2EConverter] = {}
+# Lazy-init converter shared by all users; each user's ExHentai cookie is
+# passed per convert() call
+_converter: Optional[JM2EConverter] = None
 
 
-def get_converter(exhentai_cookie: Optional[str] = None) -> JM2EConverter:
-    """Get or create a converter instance.
+def get_converter() -> JM2EConverter:
+    """Get or create the shared converter instance."""
+    global _converter
+    if _converter is None:
+        _converter = JM2EConverter()
+    return _converter
 
-    Args:
-        exhentai_cookie: Optional ExHentai cookie for accessing exhentai.org
 
-    Returns:
-        JM2EConverter instance (cached by cookie hash)
-    """
-    cache_key = str(hash(exhentai_cookie)) if exhentai_cookie else "default"
+# Recent conversion results: (jm_id, wnacg_only, has_cookie) -> (time, result).
+# Popular IDs are looked up once per TTL; cookie-gated results are kept apart
+# from anonymous ones.
+_result_cache: OrderedDict[tuple[str, bool, bool], tuple[float, ConversionResult]] = (
+    OrderedDict()
+)
+RESULT_CACHE_TTL = 600
+RESULT_CACHE_SIZE = 1024
+
+
+def _get_cached_result(key: tuple[str, bool, bool]) -> Optional[ConversionResult]:
+    """Return a cached result younger than RESULT_CACHE_TTL, else None."""
+    cached = _result_cache.get(key)
+    if cached and time.monotonic() - cached[0] < RESULT_CACHE_TTL:
+        _result_cache.move_to_end(key)
+        return cached[1]
+    return None
+
+
+def _put_cached_result(key: tuple[str, bool, bool], result: ConversionResult) -> None:
+    """Store a result, evicting the least recently used entry when full."""
+    _result_cache[key] = (time.monotonic(), result)
+    _result_cache.move_to_end(key)
+    if len(_result_cache) > RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+
+# Static reply texts, built once at import time
+_START_TEMPLATE = (
+    "🔗 *JM2E Bot* - JMComic to E-Hentai/ExHentai Converter\n\n"
+    "Send me a JMComic ID and I'll find the link for you!\n\n"
+    "*Status:* {cookie_status}\n\n"
+    "*Example:* `1180203` or `/jm 1180203`\n\n"
+    "*Search priority:*\n"
+    "1. ExHentai (if cookie set)\n"
+    "2. E-Hentai\n"
+    "3. wnacg\n\n"
+    "Use `/setcookie` to enable ExHentai search."
+)
+START_TEXT_WITH_COOKIE = _START_TEMPLATE.format(cookie_status="✅ ExHentai cookie set")
+START_TEXT_NO_COOKIE = _START_TEMPLATE.format(cookie_status="❌ No ExHentai cookie")
+
+HELP_TEXT = (
+    "📖 *How to use JM2E Bot*\n\n"
+    "*Basic usage:*\n"
+    "• Send a JMComic ID directly: `1180203`\n"
+    "• Use command: `/jm 1180203`\n"
+    "• Multiple IDs: `/jm 1180203 540930`\n\n"
+    "*Commands:*\n"
+    "/start - Start the bot\n"
+    "/help - Show this help\n"
+    "/jm <id> - Convert JMComic ID to link\n"
+    "/setcookie <cookie> - Set ExHentai cookie\n"
+    "/clearcookie - Remove ExHentai cookie\n"
+    "/status - Check current settings\n\n"
+    "*ExHentai Cookie:*\n"
+    "To access ExHentai, set your cookie with:\n"
+    "`/setcookie ipb_member_id=xxx; ipb_pass_hash=xxx; igneous=xxx`\n\n"
+    "Get your cookie from browser DevTools after logging into exhentai.org"
+)
+
+SETCOOKIE_USAGE_TEXT = (
+    "🍪 *Set ExHentai Cookie*\n\n"
+    "Usage: `/setcookie <cookie_string>`\n\n"
+    "*Supported formats:*\n"
+    "1. Standard cookie format:\n"
+    "`/setcookie ipb_member_id=123; ipb_pass_hash=abc; igneous=xyz`\n\n"
+    "2. Key: value format (from DevTools):\n"
+    "`/setcookie ipb_member_id: 123`\n"
+    "`ipb_pass_hash: abc`\n"
+    "`igneous: xyz`\n\n"
+    "*How to get your cookie:*\n"
+    "1. Log in to exhentai.org in your browser\n"
+    "2. Open DevTools (F12) → Application → Cookies\n"
+    "3. Copy `ipb_member_id`, `ipb_pass_hash`, and `igneous`"
+)
+
+COOKIE_PARSE_ERROR_TEXT = (
+    "❌ Could not parse cookie.\n\n"
+    "Please provide cookie in one of these formats:\n"
+    "• `ipb_member_id=xxx; ipb_pass_hash=xxx; igneous=xxx`\n"
+    "• `ipb_member_id: xxx` (one per line)"
+)
+
+
+def _build_status_text(has_cookie: bool, wnacg_only: bool) -> str:
+    """Build the /status reply for one settings combination."""
+    if wnacg_only:
+        priority = "wnacg only"
+    elif has_cookie:
+        priority = "ExHentai → E-Hentai → wnacg"
+    else:
+        priority = "E-Hentai → wnacg"
 
-    if cache_key not in _converters:
-        _converters[cache_key] = JM2EConverter(exhentai_cookie=exhentai_cookie)
+    return (
+        "📊 *Current Settings*\n\n"
+        f"ExHentai cookie: {'✅ Set' if has_cookie else '❌ Not set'}\n"
+        f"WNACG-only mode: {'✅ On' if wnacg_only else '❌ Off'}\n"
+        f"Search priority: {priority}"
+    )
 
-    return _converters[cache_key]
+
+# /status replies keyed by (has_cookie, wnacg_only)
+STATUS_TEXTS = {
+    (has_cookie, wnacg_only): _build_status_text(has_cookie, wnacg_only)
+    for has_cookie in (False, True)
+    for wnacg_only in (False, True)
+}
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     # Check if user has ExHentai cookie set
     has_cookie = context.user_data.get("exhentai_cookie") is not None
-    cookie_status = "✅ ExHentai cookie set" if has_cookie else "❌ No ExHentai cookie"
 
     await update.message.reply_text(
-        "🔗 *JM2E Bot* - JMComic to E-Hentai/ExHentai Converter\n\n"
-        "Send me a JMComic ID and I'll find the link for you!\n\n"
-        f"*Status:* {cookie_status}\n\n"
-        "*Example:* `1180203` or `/jm 1180203`\n\n"
-        "*Search priority:*\n"
-        "1. ExHentai (if cookie set)\n"
-        "2. E-Hentai\n"
-        "3. wnacg\n\n"
-        "Use `/setcookie` to enable ExHentai search.",
+        START_TEXT_WITH_COOKIE if has_cookie else START_TEXT_NO_COOKIE,
         parse_mode="Markdown",
     )
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
-    await update.message.reply_text(
-        "📖 *How to use JM2E Bot*\n\n"
-        "*Basic usage:*\n"
-        "• Send a JMComic ID directly: `1180203`\n"
-        "• Use command: `/jm 1180203`\n"
-        "• Multiple IDs: `/jm 1180203 540930`\n\n"
-        "*Commands:*\n"
-        "/start - Start the bot\n"
-        "/help - Show this help\n"
-        "/jm <id> - Convert JMComic ID to link\n"
-        "/setcookie <cookie> - Set ExHentai cookie\n"
-        "/clearcookie - Remove ExHentai cookie\n"
-        "/status - Check current settings\n\n"
-        "*ExHentai Cookie:*\n"
-        "To access ExHentai, set your cookie with:\n"
-        "`/setcookie ipb_member_id=xxx; ipb_pass_hash=xxx; igneous=xxx`\n\n"
-        "Get your cookie from browser DevTools after logging into exhentai.org",
-        parse_mode="Markdown",
-    )
+    await update.message.reply_text(HELP_TEXT, parse_mode="Markdown")
 
 
 async def set_cookie(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Set ExHentai cookie for the user."""
     if not context.args:
-        await update.message.reply_text(
-            "🍪 *Set ExHentai Cookie*\n\n"
-            "Usage: `/setcookie <cookie_string>`\n\n"
-            "*Supported formats:*\n"
-            "1. Standard cookie format:\n"
-            "`/setcookie ipb_member_id=123; ipb_pass_hash=abc; igneous=xyz`\n\n"
-            "2. Key: value format (from DevTools):\n"
-            "`/setcookie ipb_member_id: 123`\n"
-            "`ipb_pass_hash: abc`\n"
-            "`igneous: xyz`\n\n"
-            "*How to get your cookie:*\n"
-            "1. Log in to exhentai.org in your browser\n"
-            "2. Open DevTools (F12) → Application → Cookies\n"
-            "3. Copy `ipb_member_id`, `ipb_pass_hash`, and `igneous`",
-            parse_mode="Markdown",
-        )
+        await update.message.reply_text(SETCOOKIE_USAGE_TEXT, parse_mode="Markdown")
         return
 
     # Join all args and handle multi-line input
@@ -123,13 +188,7 @@ async def set_cookie(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     cookie = _normalize_cookie(raw_input)
 
     if not cookie:
-        await update.message.reply_text(
-            "❌ Could not parse cookie.\n\n"
-            "Please provide cookie in one of these formats:\n"
-            "• `ipb_member_id=xxx; ipb_pass_hash=xxx; igneous=xxx`\n"
-            "• `ipb_member_id: xxx` (one per line)",
-            parse_mode="Markdown",
-        )
+        await update.message.reply_text(COOKIE_PARSE_ERROR_TEXT, parse_mode="Markdown")
         return
 
     # Basic validation: check for required cookie fields
@@ -171,6 +230,20 @@ async def set_cookie(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     )
 
 
+# Characters that end a cookie token
+_COOKIE_DELIMS = ";\n"
+
+
+def _trim_span(raw: str, start: int, end: int) -> tuple[int, int]:
+    """Return the bounds of raw[start:end].strip() without slicing."""
+    while start < end and raw[start].isspace():
+        start += 1
+    while end > start and raw[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+@lru_cache(maxsize=128)
 def _normalize_cookie(raw: str) -> Optional[str]:
     """Normalize cookie input to standard format.
 
@@ -188,32 +261,43 @@ def _normalize_cookie(raw: str) -> Optional[str]:
 
     parts = {}
 
-    # Split by actual newlines and semicolons
-    # Note: Use explicit newline character, not \n in character class
-    lines = raw.replace(";", "\n").split("\n")
-
-    for token in lines:
-        token = token.strip()
-        if not token:
+    # Single pass over raw: each token runs up to the next ";" or newline.
+    # The next position of each delimiter is only searched for again once
+    # the scan has passed it.
+    n = len(raw)
+    semi = raw.find(";")
+    newline = raw.find("\n")
+    i = 0
+    while i < n:
+        if raw[i] in _COOKIE_DELIMS:
+            # Runs of delimiters (";;", blank lines) are empty tokens
+            i += 1
             continue
+        if 0 <= semi < i:
+            semi = raw.find(";", i)
+        if 0 <= newline < i:
+            newline = raw.find("\n", i)
+        j = min(semi if semi >= 0 else n, newline if newline >= 0 else n)
 
         # Try "key: value" format (from DevTools)
-        if ": " in token:
-            key, _, value = token.partition(": ")
-            key = key.strip()
-            value = value.strip()
-            if key and value:
-                parts[key] = value
+        sep = raw.find(": ", i, j)
+        if sep >= 0:
+            ks, ke = _trim_span(raw, i, sep)
+            vs, ve = _trim_span(raw, sep + 2, j)
+            if ks < ke and vs < ve:
+                parts[raw[ks:ke]] = raw[vs:ve]
+                i = j + 1
                 continue
 
         # Try "key=value" format (standard cookie)
-        if "=" in token:
-            key, _, value = token.partition("=")
-            key = key.strip()
-            value = value.strip()
-            if key and value:
-                parts[key] = value
-                continue
+        sep = raw.find("=", i, j)
+        if sep >= 0:
+            ks, ke = _trim_span(raw, i, sep)
+            vs, ve = _trim_span(raw, sep + 1, j)
+            if ks < ke and vs < ve:
+                parts[raw[ks:ke]] = raw[vs:ve]
+
+        i = j + 1
 
     if not parts:
         return None
@@ -224,8 +308,9 @@ def _normalize_cookie(raw: str) -> Optional[str]:
 
 async def clear_cookie(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Clear ExHentai cookie for the user."""
-    if "exhentai_cookie" in context.user_data:
-        del context.user_data["exhentai_cookie"]
+    user_data = context.user_data
+    if "exhentai_cookie" in user_data:
+        del user_data["exhentai_cookie"]
         await update.message.reply_text(
             "🗑️ ExHentai cookie cleared.\n\nSearches will now use E-Hentai only.",
             parse_mode="Markdown",
@@ -239,8 +324,9 @@ async def clear_cookie(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def toggle_wnacg(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Toggle WNACG-only mode (disable E-Hentai search)."""
-    current = context.user_data.get("wnacg_only", False)
-    context.user_data["wnacg_only"] = not current
+    user_data = context.user_data
+    current = user_data.get("wnacg_only", False)
+    user_data["wnacg_only"] = not current
 
     if not current:
         await update.message.reply_text(
@@ -256,24 +342,26 @@ async def toggle_wnacg(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show current user settings."""
-    has_cookie = context.user_data.get("exhentai_cookie") is not None
-    wnacg_only = context.user_data.get("wnacg_only", False)
+    user_data = context.user_data
+    has_cookie = user_data.get("exhentai_cookie") is not None
+    wnacg_only = user_data.get("wnacg_only", False)
 
-    if wnacg_only:
-        priority = "wnacg only"
-    elif has_cookie:
-        priority = "ExHentai → E-Hentai → wnacg"
-    else:
-        priority = "E-Hentai → wnacg"
-
-    status_text = (
-        "📊 *Current Settings*\n\n"
-        f"ExHentai cookie: {'✅ Set' if has_cookie else '❌ Not set'}\n"
-        f"WNACG-only mode: {'✅ On' if wnacg_only else '❌ Off'}\n"
-        f"Search priority: {priority}"
+    await update.message.reply_text(
+        STATUS_TEXTS[has_cookie, wnacg_only], parse_mode="Markdown"
     )
 
-    await update.message.reply_text(status_text, parse_mode="Markdown")
+
+def _log_lookup_errors(jm_ids: list[str], results: list) -> None:
+    """Log lookups that raised despite their own error handling.
+
+    gather(return_exceptions=True) hands exceptions back as results, so
+    without this they would disappear silently.
+    """
+    for jm_id, result in zip(jm_ids, results):
+        if isinstance(result, BaseException):
+            logger.error(
+                f"Unhandled error processing JM{jm_id}: {result!r}", exc_info=result
+            )
 
 
 async def convert_jm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -284,8 +372,35 @@ async def convert_jm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         )
         return
 
-    for jm_id in context.args:
-        await process_jm_id(update, context, jm_id)
+    # Look the IDs up concurrently; each reports its own errors
+    results = await asyncio.gather(
+        *(process_jm_id(update, context, jm_id) for jm_id in context.args),
+        return_exceptions=True,
+    )
+    _log_lookup_errors(context.args, results)
+
+
+# Result source -> emoji / display name
+SOURCE_EMOJI = {
+    "exhentai": "🔞",
+    "ehentai": "✅",
+    "wnacg": "📗",
+    "hitomi": "🔶",
+    "google": "🔍",
+    "none": "❌",
+}
+SOURCE_NAME = {
+    "exhentai": "ExHentai",
+    "ehentai": "E-Hentai",
+    "wnacg": "绅士漫画",
+    "hitomi": "Hitomi.la (search)",
+    "google": "Google (search)",
+    "none": "Not found",
+}
+
+
+# Pre-compiled regex for JMComic IDs (5-7 digits) in plain messages
+_JM_ID_RE = re.compile(r"\b(\d{5,7})\b")
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -293,19 +408,36 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     text = update.message.text.strip()
 
     # Extract all numbers that look like JMComic IDs (5-7 digits)
-    jm_ids = re.findall(r"\b(\d{5,7})\b", text)
+    jm_ids = _JM_ID_RE.findall(text)
 
     if not jm_ids:
         return  # Silently ignore non-ID messages
 
-    for jm_id in jm_ids:
-        await process_jm_id(update, context, jm_id)
+    # The regex only matches digits, so the IDs skip validation
+    results = await asyncio.gather(
+        *(_process_valid_jm_id(update, context, jm_id) for jm_id in jm_ids),
+        return_exceptions=True,
+    )
+    _log_lookup_errors(jm_ids, results)
+
+
+# Bot-wide cap on lookups running at once (multi-ID messages fan out)
+MAX_CONCURRENT_LOOKUPS = 5
+
+
+def _lookup_semaphore(context: ContextTypes.DEFAULT_TYPE) -> asyncio.Semaphore:
+    """Get the semaphore shared by all lookups, stored in bot_data."""
+    semaphore = context.application.bot_data.get("lookup_semaphore")
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_LOOKUPS)
+        context.application.bot_data["lookup_semaphore"] = semaphore
+    return semaphore
 
 
 async def process_jm_id(
     update: Update, context: ContextTypes.DEFAULT_TYPE, jm_id: str
 ) -> None:
-    """Process a single JMComic ID and send the result."""
+    """Validate a user-supplied JMComic ID, then process it."""
     # Validate ID format
     if not jm_id.isdigit():
         await update.message.reply_text(
@@ -313,38 +445,69 @@ async def process_jm_id(
         )
         return
 
-    # Get user's ExHentai cookie if set
-    exhentai_cookie = context.user_data.get("exhentai_cookie")
-    wnacg_only = context.user_data.get("wnacg_only", False)
+    await _process_valid_jm_id(update, context, jm_id)
 
-    # Send "processing" message
-    processing_msg = await update.message.reply_text(f"🔍 Looking up JM{jm_id}...")
 
+async def _convert(
+    context: ContextTypes.DEFAULT_TYPE,
+    jm_id: str,
+    wnacg_only: bool,
+    exhentai_cookie: Optional[str],
+) -> ConversionResult:
+    """Run a conversion off the event loop and cache its result.
+
+    "none" results are not cached: convert() also reports upstream errors
+    that way, and those should be retried on the next lookup.
+    """
+    conv = get_converter()
+    # convert() does blocking HTTP; keep the event loop free meanwhile
+    async with _lookup_semaphore(context):
+        result = await asyncio.to_thread(
+            conv.convert,
+            jm_id,
+            wnacg_only=wnacg_only,
+            exhentai_cookie=exhentai_cookie,
+        )
+    if result.link:
+        _put_cached_result((jm_id, wnacg_only, bool(exhentai_cookie)), result)
+    return result
+
+
+# Lookups finishing within this many seconds are answered without the
+# "Looking up..." placeholder (one message instead of send + edit)
+FAST_LOOKUP_TIMEOUT = 0.2
+
+
+async def _process_valid_jm_id(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, jm_id: str
+) -> None:
+    """Process a single (all-digit) JMComic ID and send the result."""
+    # Get user's ExHentai cookie if set
+    user_data = context.user_data
+    exhentai_cookie = user_data.get("exhentai_cookie")
+    wnacg_only = user_data.get("wnacg_only", False)
+
+    processing_msg = None
     try:
-        conv = get_converter(exhentai_cookie)
-        result = conv.convert(jm_id, wnacg_only=wnacg_only)
+        result = _get_cached_result((jm_id, wnacg_only, bool(exhentai_cookie)))
+        if result is None:
+            task = asyncio.ensure_future(
+                _convert(context, jm_id, wnacg_only, exhentai_cookie)
+            )
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.shield(task), FAST_LOOKUP_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                # Slow lookup: send "processing" message, edit it when done
+                processing_msg = await update.message.reply_text(
+                    f"🔍 Looking up JM{jm_id}..."
+                )
+                result = await task
 
         # Format response based on source
-        source_emoji = {
-            "exhentai": "🔞",
-            "ehentai": "✅",
-            "wnacg": "📗",
-            "hitomi": "🔶",
-            "google": "🔍",
-            "none": "❌",
-        }
-
-        source_name = {
-            "exhentai": "ExHentai",
-            "ehentai": "E-Hentai",
-            "wnacg": "绅士漫画",
-            "hitomi": "Hitomi.la (search)",
-            "google": "Google (search)",
-            "none": "Not found",
-        }
-
-        emoji = source_emoji.get(result.source, "📎")
-        source = source_name.get(result.source, result.source)
+        emoji = SOURCE_EMOJI.get(result.source, "📎")
+        source = SOURCE_NAME.get(result.source, result.source)
 
         if result.source == "none" or not result.link:
             response = (
@@ -362,13 +525,22 @@ async def process_jm_id(
                 f"[Open Link]({result.link})"
             )
 
-        await processing_msg.edit_text(
-            response, parse_mode="Markdown", disable_web_page_preview=True
-        )
+        if processing_msg is not None:
+            await processing_msg.edit_text(
+                response, parse_mode="Markdown", disable_web_page_preview=True
+            )
+        else:
+            await update.message.reply_text(
+                response, parse_mode="Markdown", disable_web_page_preview=True
+            )
 
     except Exception as e:
         logger.error(f"Error processing JM{jm_id}: {e}")
-        await processing_msg.edit_text(f"❌ Error processing JM{jm_id}: {str(e)}")
+        error_text = f"❌ Error processing JM{jm_id}: {str(e)}"
+        if processing_msg is not None:
+            await processing_msg.edit_text(error_text)
+        else:
+            await update.message.reply_text(error_text)
 
 
 def main() -> None:
@@ -376,8 +548,16 @@ def main() -> None:
     if not BOT_TOKEN:
         raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set")
 
-    # Create the Application with persistence for user data
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Create the Application; the rate limiter paces outgoing calls under
+    # Telegram's flood limits and retries after 429s, and concurrent updates
+    # let one chat's slow lookup not hold up the others
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(AIORateLimiter())
+        .concurrent_updates(True)
+        .build()
+    )
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
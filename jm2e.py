@@ -10,11 +10,13 @@ Query flow (4 queries max):
 
 Performance optimizations:
 - Caches derived forms (romaji, jp_kanji) per conversion
-- Uses shared HTTP client for connection pooling
+- Uses shared HTTP client for connection pooling (per-thread session for wnacg)
 - Concurrent E-Hentai searches for faster results
 """
 
 import re
+import threading
+import unicodedata
 import urllib.parse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
@@ -24,8 +26,11 @@ from typing import Optional
 
 import httpx
 import opencc_purepy as opencc
+import orjson
 import pykakasi
 import jmcomic
+from bs4 import BeautifulSoup
+from curl_cffi import requests as curl_requests
 from ehentai import get_search
 
 
@@ -57,6 +62,20 @@ def _get_http_client() -> httpx.Client:
     return _http_client
 
 
+# Per-thread curl_cffi sessions for wnacg (a Session isn't safe to share across
+# threads; searches run concurrently, and pool threads live across lookups)
+_wnacg_local = threading.local()
+
+
+def _get_wnacg_session() -> curl_requests.Session:
+    """Get or create this thread's wnacg session (keeps its TLS connection)."""
+    session = getattr(_wnacg_local, "session", None)
+    if session is None:
+        session = curl_requests.Session(impersonate="chrome")
+        _wnacg_local.session = session
+    return session
+
+
 # Extra character mappings not handled by OpenCC
 EXTRA_CHAR_MAP = {
     "糹": "糸",
@@ -132,8 +151,6 @@ def _is_katakana_word(text: str) -> bool:
     """Check if text is primarily katakana (80%+ katakana characters)."""
     if not text:
         return False
-    import unicodedata
-
     katakana_count = sum(1 for c in text if "KATAKANA" in unicodedata.name(c, ""))
     return katakana_count >= len(text) * 0.8
 
@@ -158,7 +175,7 @@ def _translate_katakana_words(katakana_words: list[str]) -> dict[str, str]:
             params={"engine": "google", "from": "ja", "to": "en", "text": combined},
         )
         if resp.status_code == 200:
-            translated = resp.json().get("translated_text", "")
+            translated = orjson.loads(resp.content).get("translated_text", "")
             # Split back and map
             parts = translated.split("|")
             result = {}
@@ -185,7 +202,7 @@ def to_romaji_with_english(text: str) -> str:
     """
     text = to_jp_kanji(text)
     # Remove special characters
-    text = re.sub(r"[①②③④⑤⑥⑦⑧⑨⑩♡♥☆★◆◇○●～〜]", " ", text)
+    text = _SPECIAL_CHARS_RE.sub(" ", text)
 
     segments = _kks.convert(text)
 
@@ -240,7 +257,7 @@ def translate_to_english(text: str, source: str = "ja") -> Optional[str]:
             params={"engine": "google", "from": source, "to": "en", "text": text},
         )
         if resp.status_code == 200:
-            return resp.json().get("translated_text")
+            return orjson.loads(resp.content).get("translated_text")
     except Exception as e:
         print(f"  Translation error: {e}")
     return None
@@ -264,14 +281,19 @@ def normalize_romaji(text: str) -> str:
     return _ROMAJI_NORM_RE.sub("", text.lower())
 
 
+# Pre-compiled regexes for [xxx] and (xxx) tags in E-Hentai titles
+_EH_BRACKET_TAG_RE = re.compile(r"\[[^\]]+\]")
+_EH_PAREN_TAG_RE = re.compile(r"\([^\)]+\)")
+
+
 def extract_eh_title_parts(eh_title: str) -> tuple[str, list[str]]:
     """Extract parts from E-Hentai title.
 
     '[Author] Romaji Title | 中文标题 [Chinese]' -> ('Romaji Title', ['中文标题'])
     """
     # Remove [xxx] and (xxx) tags
-    clean = re.sub(r"\[[^\]]+\]", "", eh_title)
-    clean = re.sub(r"\([^\)]+\)", "", clean)
+    clean = _EH_BRACKET_TAG_RE.sub("", eh_title)
+    clean = _EH_PAREN_TAG_RE.sub("", clean)
     # Split by |
     parts = [p.strip() for p in clean.split("|") if p.strip()]
 
@@ -405,6 +427,29 @@ class SearchContext:
             self.candidate_romajis.append(to_romaji(c))
 
 
+# Pre-compiled regexes for parsing JM album titles and descriptions
+_LATIN_WORD_RE = re.compile(r"[a-zA-Z]{4,}")
+_EDGE_BRACKETS_RE = re.compile(r"^\s*[\[\]]+\s*|\s*[\[\]]+\s*$")
+_TRAILING_TAGS_RE = re.compile(r"(\s*\[[^\]]*\])+\s*$")
+_AFTER_TAG_RES = (re.compile(r"\]\s*(.+)$"), re.compile(r"\)\s*(.+)$"))
+_ENGLISH_WORD_RE = re.compile(r"[a-zA-Z]{3,}")
+_JP_TITLE_RES = (
+    re.compile(r"\]\s*([^\[]*[\u3040-\u309F\u30A0-\u30FF][^\[]*)"),  # After ]
+    re.compile(
+        r"([\u3040-\u309F\u30A0-\u30FF][\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u0020-\u007E～〜]+)"
+    ),  # Kana-heavy segment
+)
+_TRAILING_TAG_RE = re.compile(r"\s*\[[^\]]*\]\s*$")
+_JP_SERIES_SUFFIX_RE = re.compile(r"[\d]+[～〜].*")
+_TRAILING_NUMBERS_RE = re.compile(r"[\d\s\+]+$")
+_PLUS_SUFFIX_RE = re.compile(r"\s*[+＋].*")
+_PAGE_COUNT_SUFFIX_RE = re.compile(r"\s*\d+P.*")
+
+# Pre-compiled regexes for parsing wnacg search results
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_CN_TRANSLATION_RE = re.compile(r"中[国國]翻[译譯]|[汉漢]化|中文")
+
+
 class JM2EConverter:
     """Converts JMComic IDs to E-Hentai/ExHentai links with fallback."""
 
@@ -461,9 +506,8 @@ class JM2EConverter:
         last_paren = title.rfind(")")
         if last_paren > 0 and last_paren < len(title) - 3:
             after_paren = title[last_paren + 1 :].strip()
-            if after_paren and re.search(r"[a-zA-Z]{4,}", after_paren):
-                after_paren = re.sub(r"^\s*[\[\]]+\s*", "", after_paren)
-                after_paren = re.sub(r"\s*[\[\]]+\s*$", "", after_paren)
+            if after_paren and _LATIN_WORD_RE.search(after_paren):
+                after_paren = _EDGE_BRACKETS_RE.sub("", after_paren)
                 if after_paren and len(after_paren) >= 4:
                     return after_paren
         return None
@@ -474,11 +518,11 @@ class JM2EConverter:
             return None
 
         # Remove common tags at the end (single pass with greedy matching)
-        clean = re.sub(r"(\s*\[[^\]]*\])+\s*$", "", description)
+        clean = _TRAILING_TAGS_RE.sub("", description)
 
         # Try to extract title after [Author] or (Circle)
-        for pattern in [r"\]\s*(.+)$", r"\)\s*(.+)$"]:
-            match = re.search(pattern, clean)
+        for pattern in _AFTER_TAG_RES:
+            match = pattern.search(clean)
             if match:
                 title = match.group(1).strip()
                 if title and len(title) >= 3:
@@ -577,9 +621,6 @@ class JM2EConverter:
             return None, 0.0
 
         try:
-            from bs4 import BeautifulSoup
-            from curl_cffi import requests as curl_requests
-
             print(f"  [ExH] Searching: {query}")
 
             # Build search URL
@@ -708,20 +749,15 @@ class JM2EConverter:
         """
         # Common patterns for Japanese titles in JM format
         # Try to find text with Japanese kana after a ] bracket
-        patterns = [
-            r"\]\s*([^\[]*[\u3040-\u309F\u30A0-\u30FF][^\[]*)",  # After ]
-            r"([\u3040-\u309F\u30A0-\u30FF][\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u0020-\u007E～〜]+)",  # Kana-heavy segment
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, full_title)
+        for pattern in _JP_TITLE_RES:
+            match = pattern.search(full_title)
             if match:
                 jp_part = match.group(1).strip()
                 # Verify it has enough kana (at least 3)
                 kana_count = sum(1 for c in jp_part if "\u3040" <= c <= "\u30ff")
                 if kana_count >= 3:
                     # Clean up: remove trailing tags like [中国翻译]
-                    jp_part = re.sub(r"\s*\[[^\]]*\]\s*$", "", jp_part).strip()
+                    jp_part = _TRAILING_TAG_RE.sub("", jp_part).strip()
                     return jp_part
         return None
 
@@ -729,9 +765,6 @@ class JM2EConverter:
         self, oname: str, candidates: list[str], full_title: str = "", author: str = ""
     ) -> tuple[Optional[str], float]:
         """Search wnacg.com for Chinese versions."""
-        from bs4 import BeautifulSoup
-        from curl_cffi import requests as curl_requests
-
         best_match_url: Optional[str] = None
         best_match_title: Optional[str] = None
         best_score = 0.0
@@ -746,12 +779,12 @@ class JM2EConverter:
                 # Convert simplified Chinese chars to Japanese kanji
                 jp_title_converted = to_jp_kanji(jp_title)
                 # Take first part (before any series markers like 2～)
-                jp_search = re.sub(r"[\d]+[～〜].*", "", jp_title_converted).strip()
+                jp_search = _JP_SERIES_SUFFIX_RE.sub("", jp_title_converted).strip()
                 if len(jp_search) >= 4:
                     search_queries.append((jp_search, True))
 
         # Also try Chinese oname
-        clean_oname = re.sub(r"[\d\s\+]+$", "", oname).strip()
+        clean_oname = _TRAILING_NUMBERS_RE.sub("", oname).strip()
         if clean_oname and len(clean_oname) >= 3:
             search_queries.append((clean_oname, False))
 
@@ -768,7 +801,7 @@ class JM2EConverter:
                 print(f"  [wnacg] Searching: {search_term[:50]}")
 
                 # Use curl_cffi to bypass wnacg's httpx blocking
-                resp = curl_requests.get(url, impersonate="chrome", timeout=15)
+                resp = _get_wnacg_session().get(url, timeout=15)
                 if resp.status_code != 200:
                     continue
 
@@ -788,12 +821,12 @@ class JM2EConverter:
                     # Get title from link title attribute or text
                     title = str(link.get("title", "")) or link.get_text(strip=True)
                     # Remove HTML tags that might be in title attribute
-                    title = re.sub(r"<[^>]+>", "", title)
+                    title = _HTML_TAG_RE.sub("", title)
                     if not title:
                         continue
 
                     # Only match Chinese versions
-                    if not re.search(r"中[国國]翻[译譯]|[汉漢]化|中文", title):
+                    if not _CN_TRANSLATION_RE.search(title):
                         continue
 
                     gallery_url = (
@@ -812,7 +845,7 @@ class JM2EConverter:
 
                     # For Chinese oname search: try candidate matching
                     for candidate in candidates:
-                        clean_candidate = re.sub(r"[\d\s\+]+$", "", candidate).strip()
+                        clean_candidate = _TRAILING_NUMBERS_RE.sub("", candidate).strip()
                         if not clean_candidate or len(clean_candidate) < 3:
                             continue
 
@@ -846,7 +879,11 @@ class JM2EConverter:
         return None, best_score
 
     def convert(
-        self, jm_id: str, concurrent: bool = True, wnacg_only: bool = False
+        self,
+        jm_id: str,
+        concurrent: bool = True,
+        wnacg_only: bool = False,
+        exhentai_cookie: Optional[str] = None,
     ) -> ConversionResult:
         """Convert JMComic ID to link with multi-query flow.
 
@@ -854,6 +891,9 @@ class JM2EConverter:
             jm_id: JMComic album ID
             concurrent: If True, run initial E-Hentai queries concurrently for speed
             wnacg_only: If True, skip E-Hentai/ExHentai and only search wnacg
+            exhentai_cookie: ExHentai cookie for this call; defaults to the one
+                            given to the constructor, so one converter can serve
+                            many users
 
         Query flow (if ExHentai cookie is provided):
         0. ExHentai: Same queries as E-Hentai but on exhentai.org (priority)
@@ -867,6 +907,8 @@ class JM2EConverter:
         3c. E-Hentai: Extracted JP title from full title
         4. wnacg: Chinese title search (fallback)
         """
+        exhentai_cookie = exhentai_cookie or self.exhentai_cookie
+
         info = self.get_jm_info(jm_id)
         title = info["title"]
         author = info["author"]
@@ -914,14 +956,14 @@ class JM2EConverter:
 
         # Check for existing English title in description/title
         english_from_desc = self._extract_title_from_description(description)
-        has_english_desc = english_from_desc and re.search(
-            r"[a-zA-Z]{3,}", english_from_desc
+        has_english_desc = english_from_desc and _ENGLISH_WORD_RE.search(
+            english_from_desc
         )
 
         # Also check for English appended at end of title
         english_from_title = self._extract_english_from_title(title)
-        has_english_title = english_from_title and re.search(
-            r"[a-zA-Z]{3,}", english_from_title
+        has_english_title = english_from_title and _ENGLISH_WORD_RE.search(
+            english_from_title
         )
 
         # Best English title
@@ -966,12 +1008,12 @@ class JM2EConverter:
                 queries.append((query2, "query2", romaji_eng))
 
         # --- ExHentai search (if cookie is provided) ---
-        if self.exhentai_cookie:
+        if exhentai_cookie:
             print("  → Trying ExHentai (with cookie)...")
             for query, name, eng_hint in queries:
                 # Use same query with l:chinese filter
                 link, sim = self.search_exhentai_single(
-                    query, candidates, eng_hint, self.exhentai_cookie
+                    query, candidates, eng_hint, exhentai_cookie
                 )
                 if link:
                     return ConversionResult(
@@ -994,7 +1036,7 @@ class JM2EConverter:
                         translated = " ".join(trans_words[:4])
                     exh_query = f"{ctx.author_romaji} {translated} l:chinese".strip()
                     link, sim = self.search_exhentai_single(
-                        exh_query, candidates, translated, self.exhentai_cookie
+                        exh_query, candidates, translated, exhentai_cookie
                     )
                     if link:
                         return ConversionResult(
@@ -1013,7 +1055,7 @@ class JM2EConverter:
                 print("  → Trying Japanese title search (ExHentai)...")
                 exh_query = f"{jp_oname} l:chinese"
                 link, sim = self.search_exhentai_single(
-                    exh_query, candidates, english_title, self.exhentai_cookie
+                    exh_query, candidates, english_title, exhentai_cookie
                 )
                 if link:
                     return ConversionResult(
@@ -1029,8 +1071,8 @@ class JM2EConverter:
             # Extracted JP title on ExHentai
             jp_from_title = self._extract_jp_title(title)
             if jp_from_title:
-                jp_search = re.sub(r"\s*[+＋].*", "", jp_from_title).strip()
-                jp_search = re.sub(r"\s*\d+P.*", "", jp_search).strip()
+                jp_search = _PLUS_SUFFIX_RE.sub("", jp_from_title).strip()
+                jp_search = _PAGE_COUNT_SUFFIX_RE.sub("", jp_search).strip()
                 jp_search = to_jp_kanji(jp_search)
                 if jp_search and len(jp_search) >= 3 and jp_search != jp_oname:
                     print(
@@ -1038,7 +1080,7 @@ class JM2EConverter:
                     )
                     exh_query = f"{ctx.author_jp} {jp_search} l:chinese".strip()
                     link, sim = self.search_exhentai_single(
-                        exh_query, candidates, english_title, self.exhentai_cookie
+                        exh_query, candidates, english_title, exhentai_cookie
                     )
                     if link:
                         return ConversionResult(
@@ -1121,8 +1163,8 @@ class JM2EConverter:
             # --- Query 3c: Extract Japanese title from full title ---
             jp_from_title = self._extract_jp_title(title)
             if jp_from_title:
-                jp_search = re.sub(r"\s*[+＋].*", "", jp_from_title).strip()
-                jp_search = re.sub(r"\s*\d+P.*", "", jp_search).strip()
+                jp_search = _PLUS_SUFFIX_RE.sub("", jp_from_title).strip()
+                jp_search = _PAGE_COUNT_SUFFIX_RE.sub("", jp_search).strip()
                 jp_search = to_jp_kanji(jp_search)
                 if jp_search and len(jp_search) >= 3 and jp_search != jp_oname:
                     print(f"  → Trying extracted JP title: {ctx.author_jp} {jp_search}")
@@ -0,0 +1,126 @@
+"""Differential tests for the cookie parsers.
+
+The webhook's normalize_cookie and bot.py's single-pass _normalize_cookie
+must both give the same result as the original split/partition parser.
+
+Run with: python -m unittest discover tests
+"""
+
+import importlib.util
+import random
+import unittest
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load(name, path):
+    """Import a module from a file path (api/ is not a package)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+webhook = _load("webhook", _ROOT / "api" / "webhook.py")
+bot = _load("bot", _ROOT / "bot.py")
+
+PARSERS = {
+    "webhook": webhook.normalize_cookie,
+    "bot": bot._normalize_cookie,
+}
+
+
+def reference_normalize_cookie(raw):
+    """The original token-by-token parser."""
+    if not raw:
+        return None
+
+    parts = {}
+    lines = raw.replace(";", "\n").split("\n")
+
+    for token in lines:
+        token = token.strip()
+        if not token:
+            continue
+
+        # Try "key: value" format
+        if ": " in token:
+            key, _, value = token.partition(": ")
+            key = key.strip()
+            value = value.strip()
+            if key and value:
+                parts[key] = value
+                continue
+
+        # Try "key=value" format
+        if "=" in token:
+            key, _, value = token.partition("=")
+            key = key.strip()
+            value = value.strip()
+            if key and value:
+                parts[key] = value
+                continue
+
+    if not parts:
+        return None
+
+    return "; ".join(f"{k}={v}" for k, v in parts.items())
+
+
+class NormalizeCookieTest(unittest.TestCase):
+    CASES = [
+        "",
+        "garbage",
+        "ipb_member_id=123; ipb_pass_hash=abc; igneous=xyz",
+        "ipb_member_id: 123\nipb_pass_hash: abc\nigneous: xyz",
+        "ipb_member_id: 123\r\nipb_pass_hash: abc\r\n",
+        # "\r" alone is whitespace, not a separator
+        "a=b\rc=d",
+        "\xa0ipb_member_id\v=\f123\xa0;\u3000igneous: xyz\x1c",
+        "  ipb_member_id = 1 ;;\n\n ipb_pass_hash=a=b; x: y=z; bad; key: ; k2=  ",
+        # Duplicate keys: the last value wins
+        "ipb_member_id=1; ipb_member_id=2; ipb_pass_hash=3",
+        "ipb_member_id: 1\nipb_pass_hash=abc\nipb_member_id: 2",
+        # "key:value" without a space is not a DevTools pair
+        "https://e-hentai.org",
+        "k:v",
+        "a: b: c",
+        "a : b",
+        ": a: b",
+        "a=b: ",
+        "a=;b=2",
+        ";;;",
+    ]
+
+    def test_matches_reference_parser(self):
+        for name, parse in PARSERS.items():
+            for raw in self.CASES:
+                with self.subTest(parser=name, raw=raw):
+                    self.assertEqual(parse(raw), reference_normalize_cookie(raw))
+
+    def test_duplicate_key_keeps_last_value(self):
+        for name, parse in PARSERS.items():
+            with self.subTest(parser=name):
+                self.assertEqual(
+                    parse("ipb_member_id=1; ipb_member_id=2; ipb_pass_hash=3"),
+                    "ipb_member_id=2; ipb_pass_hash=3",
+                )
+
+    def test_key_colon_value_without_space_is_rejected(self):
+        for name, parse in PARSERS.items():
+            with self.subTest(parser=name):
+                self.assertIsNone(parse("https://e-hentai.org"))
+
+    def test_matches_reference_parser_on_random_input(self):
+        rng = random.Random(0)
+        alphabet = "ab=: ;\n\t\r\v\xa0"
+        for _ in range(20000):
+            raw = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 14)))
+            for name, parse in PARSERS.items():
+                with self.subTest(parser=name, raw=raw):
+                    self.assertEqual(parse(raw), reference_normalize_cookie(raw))
+
+
+if __name__ == "__main__":
+    unittest.main()